@@ -5,18 +5,57 @@ import requests
 import os
 import csv
 
+from wire import post_matrices, read_response, accept_header
+
+# Seconds the coordinator may hold each result request open
+RESULT_POLL_WAIT = 30
+# Decomposition to ask the coordinator for (strassen, rows, cols, inner, tiles, sparse); empty lets it choose
+DECOMPOSITION = os.environ.get('DECOMPOSITION', '').lower()
+# Bytes of a memory-mapped input read per chunk of the streamed submission
+CHUNK_BYTES = int(os.environ.get('CHUNK_BYTES', 8 << 20))
+# Compute the expected product locally and compare (0 skips it, for inputs too large for client RAM)
+VERIFY = os.environ.get('VERIFY', '1') == '1'
+
 def generate_random_matrix(rows, cols):
     """Generate a random matrix with integer values"""
     return np.random.randint(0, 10, size=(rows, cols))
 
-def retrieve_matrices_from_file(filename):
-    """Returns 2 matrices pulled from a text file"""
+def parse_text_matrix(block):
+    """Parse rows of whitespace-separated numbers, as integers if every value is one"""
+    rows = [line for line in block.split("\n") if line.strip()]
+    values = np.fromstring(" ".join(rows), sep=" ")
+    if np.all(values == np.rint(values)) and np.abs(values).max(initial=0) < 2 ** 53:
+        values = values.astype(np.int64)
+    return values.reshape(len(rows), -1)
+
+def load_matrix(path):
+    """Open one matrix without reading it: a .npy file, or a raw binary file given as path:rows,cols[:dtype] (float64 by default)"""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    spec = path.rsplit(":", 2)
+    dtype = np.float64
+    if len(spec) == 3 and "," not in spec[2]:
+        filename, shape, dtype = spec
+    else:
+        filename, shape = path.rsplit(":", 1)
+    return np.memmap(filename, dtype=dtype, mode="r", shape=tuple(int(x) for x in shape.split(",")))
+
+def retrieve_matrices_from_file(paths):
+    """Returns 2 matrices from a text file, an .npz file, or two .npy/raw binary files (memory-mapped)
+
+    An .npz file holds matrix_a and matrix_b (or any two arrays, in order);
+    its members are read whole, since NumPy cannot map them.
+    """
     try:
-        with open(filename) as f:
-            A, B = f.read().split("\n\n")
-        A = np.matrix(";".join(A.split("\n")))
-        B = np.matrix(";".join(B.split("\n")))
-        return A, B
+        if len(paths) == 2:
+            return load_matrix(paths[0]), load_matrix(paths[1])
+        if paths[0].endswith(".npz"):
+            with np.load(paths[0]) as archive:
+                names = ["matrix_a", "matrix_b"] if {"matrix_a", "matrix_b"} <= set(archive.files) else archive.files[:2]
+                return archive[names[0]], archive[names[1]]
+        with open(paths[0]) as f:
+            A, B = f.read().split("\n\n", 1)
+        return parse_text_matrix(A), parse_text_matrix(B)
     except Exception as e:
         print(f"Error opening file: {e}")
         return None, None
@@ -24,12 +63,14 @@ def retrieve_matrices_from_file(filename):
 def multiply_matrices(coordinator_url, matrix_a, matrix_b):
     """Submit a matrix multiplication task to the coordinator"""
     try:
-        response = requests.post(
+        response = post_matrices(
+            requests,
             f"{coordinator_url}/submit",
-            json={
-                'matrix_a': matrix_a.tolist(),
-                'matrix_b': matrix_b.tolist()
-            },
+            {'decomposition': DECOMPOSITION} if DECOMPOSITION else {},
+            [matrix_a, matrix_b],
+            ['matrix_a', 'matrix_b'],
+            # Mapped inputs are streamed from disk instead of being copied into the request
+            chunk_bytes=CHUNK_BYTES if any(isinstance(m, np.memmap) for m in (matrix_a, matrix_b)) else 0,
             timeout=10
         )
         
@@ -47,31 +88,62 @@ def multiply_matrices(coordinator_url, matrix_a, matrix_b):
         print(f"Error during submission: {e}")
         return None
 
+def wait_for_result(coordinator_url, task_id):
+    """Long-poll the coordinator until the task's result is ready"""
+    try:
+        while True:
+            response = requests.get(
+                f"{coordinator_url}/jobs/{task_id}/result",
+                params={'wait': RESULT_POLL_WAIT},
+                headers=accept_header(),
+                timeout=RESULT_POLL_WAIT + 10
+            )
+
+            # Still running, ask again
+            if response.status_code == 202:
+                continue
+
+            if response.status_code != 200:
+                print(f"Error retrieving result: {response.status_code} {response.text}")
+                return None
+
+            _, (result,) = read_response(response, ['result'])
+            return result
+
+    except Exception as e:
+        print(f"Error while waiting for result: {e}")
+        return None
+
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python client.py <coordinator_url> <matrix_a_size> <matrix_b_size>")
-        print("   OR: python client.py <coordinator_url> -f <filepath>")
+    args = sys.argv[1:]
+    log = "-l" in args
+    if log:
+        log_file = args[args.index("-l") + 1]
+        del args[args.index("-l"):args.index("-l") + 2]
+
+    if len(args) < 3:
+        print("Usage: python client.py <coordinator_url> <matrix_a_size> <matrix_b_size> [-l <log_file>]")
+        print("   OR: python client.py <coordinator_url> -f <filepath> [<filepath>] [-l <log_file>]")
         print("Example: python client.py http://localhost:5000 4,4 4,3")
         print("     OR: python client.py http://localhost:5000 -f data/matrices.txt")
+        print("     OR: python client.py http://localhost:5000 -f data/matrices.npz")
+        print("     OR: python client.py http://localhost:5000 -f data/a.npy data/b.bin:1024,512:float32")
         return 1
     
-    log = False
-    if len(sys.argv) == 6:
-        log = True
-        log_file = sys.argv[5]
-    
-    coordinator_url = sys.argv[1]
+    coordinator_url = args[0]
     
     #either pulls matrices from a file or randomly generates a matrix
-    if sys.argv[2] == "-f":
-        filename = sys.argv[3]
-        matrix_a, matrix_b = retrieve_matrices_from_file(filename)
-        if not isinstance(matrix_a, np.matrix) or not isinstance(matrix_b, np.matrix):
+    if args[1] == "-f":
+        matrix_a, matrix_b = retrieve_matrices_from_file(args[2:4])
+        if matrix_a is None or matrix_b is None:
+            return 1
+        if matrix_a.ndim != 2 or matrix_b.ndim != 2 or matrix_a.shape[1] != matrix_b.shape[0]:
+            print(f"Incompatible matrix dimensions: {matrix_a.shape} and {matrix_b.shape}")
             return 1
     else:
         # Parse matrix sizes
-        a_size = [int(x) for x in sys.argv[2].split(',')]
-        b_size = [int(x) for x in sys.argv[3].split(',')]
+        a_size = [int(x) for x in args[1].split(',')]
+        b_size = [int(x) for x in args[2].split(',')]
     
         if len(a_size) != 2 or len(b_size) != 2:
             print("Matrix sizes should be specified as rows,cols")
@@ -91,24 +163,21 @@ def main():
     print(matrix_b)
     
     # Calculate expected result using numpy
-    start_time = time.time_ns()
-    expected = matrix_a @ matrix_b
-    end_time = time.time_ns()
-    print("\nExpected result:")
-    print(expected)
-
-    expected_time = end_time - start_time
+    expected = None
+    expected_time = 0
+    if VERIFY:
+        start_time = time.time_ns()
+        expected = matrix_a @ matrix_b
+        end_time = time.time_ns()
+        print("\nExpected result:")
+        print(expected)
+
+        expected_time = end_time - start_time
     
-    with open("app/data/expected.txt", 'w') as f:
-        f.write(";\n".join(" ".join(str(y) for y in x) for x in expected.tolist()))
+        with open("app/data/expected.txt", 'w') as f:
+            f.write(";\n".join(" ".join(str(y) for y in x) for x in expected.tolist()))
 
     
-    # Delete previous task's result
-    if os.path.exists("app/data/results.txt"):
-        os.remove("app/data/results.txt")
-
-
-
     # Submit task to coordinator
     print("\nSubmitting task to coordinator...")
     
@@ -118,20 +187,15 @@ def main():
     if not task_id:
         return 1
 
-    print("Final result can be found in app/data/results.txt or in the console log of the coordinator")
     print("Waiting for result to validate...")
-    while not os.path.exists("app/data/results.txt"): pass
+    result = wait_for_result(coordinator_url, task_id)
     end_time = time.time_ns()
 
+    if result is None:
+        return 1
+
     result_time = end_time - start_time
-    time.sleep(0.25)
-
-    with open("app/data/results.txt", 'r') as f:
-        result = f.read()
-    with open("app/data/expected.txt") as f:
-        expected = f.read()
-    result = np.matrix(result)
-    expected = np.matrix(result)
+
     print("\nResult:")
     print(result)
 
@@ -139,10 +203,11 @@ def main():
     if log:
         with open(log_file, "a", newline='') as c:
             writer = csv.writer(c, delimiter=',')
-            writer.writerow(a_size + b_size + [expected_time / 1e6, result_time / 1e6]) # time in ms
+            writer.writerow(list(matrix_a.shape) + list(matrix_b.shape) + [expected_time / 1e6, result_time / 1e6]) # time in ms
 
     # validate results
-    # for some reason, it isn't working with matrices of large size (> 1024x1024). Likely due to memory constraints
+    if expected is None:
+        return 0
     if result.shape == expected.shape and (result == expected).all():
         print("Results match!")
         return 0
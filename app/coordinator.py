@@ -1,128 +1,942 @@
 import os
+import time
 import numpy as np
 import threading
 import logging
-from flask import Flask, request, jsonify
+import itertools
+import queue
+from collections import Counter, OrderedDict
+from flask import Flask, Response, request, jsonify
 
-from utils import Task, TaskType, pad_matrices, unpad_matrix, create_retry_session
+from utils import Task, TaskType, encode_task_response, compute_dtypes, density, tile_grid, tile_products, cast_result, pad_matrices, unpad_matrix, PEEL_KEYS, BATCH_KEYS, strassen_products, peel_corrections, block_products, assemble_blocks, is_zero_matrix, product_shape, create_retry_session, send_task
+from wire import read_payload, encode_response, post_matrices, shm_host_id, is_local_peer
+from scheduler import Scheduler, ReadyQueue
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
-session = create_retry_session()
 
 # Environment variables
 NODE_ID = os.environ.get('NODE_ID', 'coordinator')
 PORT = int(os.environ.get('PORT', 5000))
+# Levels of the Strassen tree expanded by the coordinator at submission (0 = worker-driven)
+PLANNER_DEPTH = int(os.environ.get('PLANNER_DEPTH', 0))
+DISPATCH_THREADS = int(os.environ.get('DISPATCH_THREADS', 16))
+# Times a dispatch waits for a busy (503) or missing worker before its job fails
+BUSY_RETRIES = int(os.environ.get('BUSY_RETRIES', 60))
+# "pad" to the next power of 2, or "peel" odd rows/columns at each level instead
+PADDING_MODE = os.environ.get('PADDING_MODE', 'pad').lower()
+# Pick a block decomposition for non-square jobs instead of padding them to a square
+SHAPE_PLANNER = os.environ.get('SHAPE_PLANNER', '1') == '1'
+# Jobs whose largest/smallest dimension ratio is at most this are treated as square
+SQUARE_RATIO = float(os.environ.get('SQUARE_RATIO', 2))
+# Number of blocks for row/column/inner splits and of tiles for tiled jobs (0 = one per registered worker)
+BLOCK_COUNT = int(os.environ.get('BLOCK_COUNT', 0))
+# Width of the K-blocks each tile of a tiled job accumulates over (0 = a single block)
+TILE_K_BLOCK = int(os.environ.get('TILE_K_BLOCK', 512))
+# Jobs with an operand at most this dense skip padding and Strassen, going to one worker's sparse kernel (0 disables)
+SPARSE_CUTOFF = float(os.environ.get('SPARSE_CUTOFF', 0.05))
+# Bounds of the finished-job result store
+RESULT_STORE_SIZE = int(os.environ.get('RESULT_STORE_SIZE', 32))
+RESULT_STORE_BYTES = int(os.environ.get('RESULT_STORE_BYTES', 1 << 30))
+RESULT_TTL = float(os.environ.get('RESULT_TTL', 600))
+# Directory finished results are written to, and their formats: "npy" (results.npy) and/or "text" (results.txt)
+RESULT_DIR = os.environ.get('RESULT_DIR', '/app/data')
+RESULT_FORMATS = [name for name in os.environ.get('RESULT_FORMATS', 'npy').lower().split(',') if name]
+# Longest a client may long-poll for a result in one request (seconds)
+MAX_RESULT_WAIT = float(os.environ.get('MAX_RESULT_WAIT', 60))
+# Bytes of completed products kept to answer repeated (sub)problems without dispatching them (0 disables)
+PRODUCT_CACHE_BYTES = int(os.environ.get('PRODUCT_CACHE_BYTES', 256 << 20))
+# "direct" has workers send split results straight to a pre-chosen combine worker
+ROUTING = os.environ.get('ROUTING', 'coordinator').lower()
+# Worker selection policy: "round_robin", "least_loaded" or "p2c"
+SCHEDULER = os.environ.get('SCHEDULER', 'least_loaded').lower()
+# Integer jobs accumulate in int64 ("int64"), or in exact BLAS-backed float64 when the values are small enough ("auto")
+ACCUMULATE = os.environ.get('ACCUMULATE', 'auto').lower()
+# "push" sends tasks to workers as they are created; "pull" queues them for workers to take from /next
+DISPATCH_MODE = os.environ.get('DISPATCH_MODE', 'push').lower()
+# Longest a worker may long-poll /next in one request (seconds)
+MAX_PULL_WAIT = float(os.environ.get('MAX_PULL_WAIT', 30))
+# A dispatched task must be reported within LEASE_MIN seconds plus LEASE_FACTOR times
+# its estimated compute time on its worker, or it is dispatched again (at most MAX_REDISPATCH times)
+LEASE_MIN = float(os.environ.get('LEASE_MIN', 30))
+LEASE_FACTOR = float(os.environ.get('LEASE_FACTOR', 10))
+MAX_REDISPATCH = int(os.environ.get('MAX_REDISPATCH', 3))
+# Workers silent for WORKER_TIMEOUT seconds are dropped and their tasks dispatched elsewhere
+WORKER_TIMEOUT = float(os.environ.get('WORKER_TIMEOUT', 15))
+LEASE_CHECK_INTERVAL = float(os.environ.get('LEASE_CHECK_INTERVAL', 1))
+# Once a job has at most SPECULATE_TAIL tasks out, back up any running SPECULATE_FACTOR times
+# longer than the median of at least SPECULATE_MIN_SAMPLES finished tasks of the same shape
+SPECULATE = os.environ.get('SPECULATE', '1') == '1'
+SPECULATE_TAIL = int(os.environ.get('SPECULATE_TAIL', 4))
+SPECULATE_FACTOR = float(os.environ.get('SPECULATE_FACTOR', 2))
+SPECULATE_MIN_SAMPLES = int(os.environ.get('SPECULATE_MIN_SAMPLES', 3))
+# Locks the active task table is striped over, so results of unrelated tasks never wait on each other
+TASK_LOCK_STRIPES = int(os.environ.get('TASK_LOCK_STRIPES', 64))
+
+session = create_retry_session(pool_maxsize=DISPATCH_THREADS)
 
 # Track active workers and tasks
 workers = {}  # Map worker_id to URL
+worker_profiles = {}  # Map worker_id to its reported cutoffs and measurements
 active_tasks = {}  # Map task_id to task details
-pending_results = {}  # Map task_id to [received_subtasks_count, results_list]
+coalesced_tasks = {}  # Map in-flight MULTIPLY task_id to the identical tasks waiting for its result
+coalesce_stats = {'coalesced': 0, 'fanned_out': 0, 'ops_saved': 0, 'bytes_saved': 0}
+pending_results = {}  # Map task_id to the ResultSlots its subtasks' results fill
 client_tasks = {}  # Map client_task_id to original dimensions
+jobs = {}  # Map client_task_id to its Job
+block_splits = {}  # Map task_id to (kind, block_count, columns) for row/column/inner and tiled decompositions
+worker_seen = {}  # Map worker_id to the time of its last heartbeat
+leases = {}  # Map dispatched task_id to its Lease until the task is reported
+redispatches = {}  # Map task_id to the number of times its lease expired
+split_tasks = {}  # Map task_id to the route it was split under and the products handed back, so a duplicate copy's split is ignored
+route_epochs = itertools.count()  # Numbers each routed split, so a redone split never looks like a duplicate
+routed_splits = {}  # Map task_id to the IDs of the children its current routed split sent out
+
+# Picks workers and tracks the work each one has in flight
+scheduler = Scheduler(SCHEDULER)
+# Tasks waiting to be pulled by workers (pull mode)
+ready_queue = ReadyQueue(levels=3)
+
+# Tasks waiting for one of DISPATCH_THREADS dispatcher threads to send them to a worker (push mode)
+dispatch_queue = ReadyQueue(levels=3)
+dispatchers = []  # Started by the first push-mode dispatch
+
+# Locks for thread safety. Each guards only its own state, and none is held around I/O,
+# printing or matrix work. A task stripe or lease_lock may be held while taking a job's
+# lock or coalesce_lock, never the other way round. jobs, client_tasks, block_splits and
+# pending_results are only read and changed one dict operation at a time, which the GIL
+# keeps atomic, and each Job guards its own counters.
+workers_lock = threading.Lock()  # workers, worker_profiles and worker_seen
+lease_lock = threading.Lock()  # leases, redispatches, split_tasks and routed_splits
+coalesce_lock = threading.Lock()  # coalesce_stats
+dispatchers_lock = threading.Lock()  # dispatchers
+task_locks = [threading.Lock() for _ in range(max(TASK_LOCK_STRIPES, 1))]  # active_tasks and coalesced_tasks, striped by task ID
+
+def task_lock(task_id):
+    """The stripe lock guarding a task ID's entries in active_tasks and coalesced_tasks"""
+    return task_locks[hash(task_id) % len(task_locks)]
+
+# Task types whose ID identifies their result, so identical tasks can share it
+CONTENT_TASK_TYPES = (TaskType.MULTIPLY, TaskType.TILE)
+
+class Job:
+    """Per-job bookkeeping, including the Strassen graph when the coordinator plans it"""
+    def __init__(self, job_id, depth=0, result_dtype=None):
+        self.job_id = job_id
+        self.depth = depth
+        self.result_dtype = result_dtype  # Dtype returned to the client (None keeps the computed one)
+        self.nodes = {}  # Map task_id to every Task in the graph
+        self.children = {}  # Map internal task_id to its 7 child task_ids
+        self.leaves = []  # Tasks with no children, ready for dispatch
+        self.duplicates = []  # Tasks identical to one already in the graph, which share its result
+        self.zero_slots = []  # (parent_id, m_number, shape, dtype) of products with a zero factor
+        self.skipped = 0  # Subtasks resolved to zero without being dispatched
+        self.decomposition = "strassen"
+        self.submitted_at = time.time()
+        self.durations = {}  # Map task size key to the run times of its reported tasks
+        self.redispatched = 0  # Tasks sent again after their lease expired
+        self.speculated = 0  # Backup copies of slow tasks
+        self.cached = 0  # Products answered from the product cache
+        self.coalesced = 0  # Tasks that shared the result of an identical task in flight
+        self.wire = Counter()  # Codec stats of the binary payloads the coordinator sent and received for the job
+        self.lock = threading.Lock()  # Guards the counters, durations and wire stats once the job is registered
+
+    def describe(self):
+        """Short summary of the job for logging"""
+        with self.lock:
+            return (f"{self.decomposition}, depth {self.depth}, {len(self.children)} internal nodes, {len(self.leaves)} leaves, "
+                    f"{self.skipped} skipped, {self.cached} cached, {self.coalesced} coalesced, "
+                    f"{self.redispatched} redispatched, {self.speculated} speculated{self.describe_wire()}")
+
+    def count(self, **counts):
+        """Add to the job's counters (e.g. skipped=1)"""
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def describe_wire(self):
+        """Compression ratio and codec time of the job's payloads, if any were binary"""
+        if not self.wire['wire_bytes']:
+            return ""
+        codec_ms = (self.wire['encode_seconds'] + self.wire['decode_seconds']) * 1000
+        return (f", wire {self.wire['raw_bytes'] / self.wire['wire_bytes']:.1f}x "
+                f"({self.wire['wire_bytes']} of {self.wire['raw_bytes']} bytes, {codec_ms:.1f} ms in codecs)")
+
+    def add_children(self, parent_id, children):
+        """Add the children of a node to the graph, returning the ones not already in it
+
+        A child identical to a task already in the graph is set aside in
+        duplicates, to be coalesced onto that task when the graph is registered.
+        """
+        added = []
+        for child in children:
+            if child.task_id in self.nodes:
+                self.duplicates.append(child)
+            else:
+                self.nodes[child.task_id] = child
+                added.append(child)
+        self.children[parent_id] = [child.task_id for child in children]
+        return added
+
+class Lease:
+    """A dispatched task and the deadline by which one of its copies must be reported"""
+    def __init__(self, task, worker_id, duration):
+        self.task = task
+        self.worker_ids = [worker_id]  # Workers running a copy (more than one once speculated)
+        self.started = time.time()
+        self.deadline = self.started + duration
+        self.speculated = False
+
+class Dispatch:
+    """A task on its way to a worker in push mode, with what its earlier attempts learned"""
+    def __init__(self, task, exclude=()):
+        self.task = task
+        self.exclude = set(exclude)  # Workers used only if there is no other choice
+        self.unreachable = set()  # Workers that failed to take the task
+        self.waits = 0  # Times the task went back to the queue to wait for a free worker
+
+class ResultSlots:
+    """The results a parent waits for, filled without a lock
+
+    Each fill claims its slot with dict.setdefault under a token of its own,
+    so only the first fill of a slot wins even when the same result object
+    is filled twice (coalesced identical tasks share one). The claimed slots
+    are counted with next() on an itertools.count. Both are single atomic
+    steps under the GIL, so exactly one fill sees the last slot go in.
+    """
+    def __init__(self, count):
+        self.count = count
+        self.results = {}  # Map m_number to (token of the fill that claimed it, result)
+        self.filled = itertools.count(1)
+
+    def fill(self, m_number, result):
+        """Store a result, returning every result in slot order if this filled the last slot (None otherwise, or if the slot was taken)"""
+        token = object()
+        if self.results.setdefault(m_number, (token, result))[0] is not token:
+            return None
+        if next(self.filled) < self.count:
+            return None
+        return [self.results[i][1] for i in range(self.count)]
+
+class ResultSink:
+    """Writes each finished result to disk from one background thread, so no request waits on file I/O"""
+    def __init__(self, directory, formats):
+        self.directory = directory
+        self.formats = formats
+        self.queue = queue.Queue()  # (job_id, result) in the order jobs finished
+        self.written = 0
+
+    def put(self, job_id, result):
+        """Queue a result to be written (the array must not be modified afterwards)"""
+        if self.formats:
+            self.queue.put((job_id, result))
+
+    def run(self):
+        while True:
+            job_id, result = self.queue.get()
+            try:
+                self.write(result)
+                self.written += 1
+            except Exception as e:
+                print(f"Error writing result of job {job_id}: {e}")
+
+    def write(self, result):
+        """Replace the result files with result, each written under a temporary name first so readers never see a partial file"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.formats:
+            path = os.path.join(self.directory, f"results.{'txt' if name == 'text' else name}")
+            temp = f"{path}.{os.getpid()}.tmp"
+            if name == "npy":
+                # Only the header is built in memory; the values are copied straight into the mapped file
+                out = np.lib.format.open_memmap(temp, mode="w+", dtype=result.dtype, shape=result.shape)
+                out[...] = result
+                out.flush()
+                del out
+            elif name == "text":
+                with open(temp, "w") as f:
+                    f.write(";\n".join(" ".join(str(y) for y in x) for x in result.tolist()))
+            else:
+                print(f"Unknown result format {name!r}, skipping it")
+                continue
+            os.replace(temp, path)
+
+class ResultStore:
+    """Bounded store of finished jobs with TTL eviction and long-poll waiting"""
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Map job_id to {status, result, error, summary, finished_at}
+        self.nbytes = 0
+        self.condition = threading.Condition()
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones until within bounds (caller holds condition)
+
+        The newest entry is only dropped once it expires, even if it alone
+        exceeds the bounds, so the client of a large result can still fetch it.
+        """
+        now = time.time()
+        while self.entries:
+            job_id, entry = next(iter(self.entries.items()))
+            expired = now - entry["finished_at"] > self.ttl
+            within_bounds = len(self.entries) <= self.max_entries and self.nbytes <= self.max_bytes
+            if not expired and (within_bounds or len(self.entries) == 1):
+                break
+            self._remove(job_id)
+
+    def _remove(self, job_id):
+        entry = self.entries.pop(job_id)
+        if entry["result"] is not None:
+            self.nbytes -= entry["result"].nbytes
+
+    def put(self, job_id, result=None, error=None, summary=None):
+        """Record a finished (or failed) job and wake any clients waiting for it"""
+        with self.condition:
+            if job_id in self.entries:
+                self._remove(job_id)
+            self.entries[job_id] = {
+                "status": "failed" if error else "done",
+                "result": result,
+                "error": error,
+                "summary": summary,
+                "finished_at": time.time()
+            }
+            if result is not None:
+                self.nbytes += result.nbytes
+            self._evict()
+            self.condition.notify_all()
+
+    def get(self, job_id):
+        """Return the stored entry for a job, or None if it is unknown or evicted"""
+        with self.condition:
+            self._evict()
+            return self.entries.get(job_id)
 
-# Lock for thread safety
-lock = threading.Lock()
+    def wait(self, job_id, timeout, is_running):
+        """Block until a job finishes, it stops running, or timeout elapses"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while job_id not in self.entries and is_running(job_id):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.entries.get(job_id)
 
-def register_worker(worker_id, worker_url):
+result_store = ResultStore(RESULT_STORE_SIZE, RESULT_STORE_BYTES, RESULT_TTL)
+result_sink = ResultSink(RESULT_DIR, RESULT_FORMATS)
+
+class ProductCache:
+    """Completed products keyed by MULTIPLY or TILE task ID (a hash of the operands), least recently used evicted first"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Map task_id to its read-only result, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, task_id):
+        """Return the cached product of a task, or None"""
+        with self.lock:
+            result = self.entries.get(task_id)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(task_id)
+            self.hits += 1
+            return result
+
+    def put(self, task_id, result):
+        """Remember a task's product, evicting the least recently used ones beyond max_bytes"""
+        if result.nbytes > self.max_bytes:
+            return
+        # Callers share the cached array, so nobody may change it
+        result = result.view()
+        result.flags.writeable = False
+        with self.lock:
+            previous = self.entries.pop(task_id, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self.entries[task_id] = result
+            self.nbytes += result.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+product_cache = ProductCache(PRODUCT_CACHE_BYTES)
+
+def choose_decomposition(m, k, n, num_workers):
+    """Pick how to split an (m x k) @ (k x n) job, returning (kind, block_count, reason)"""
+    count = BLOCK_COUNT or max(num_workers, 1)
+    ratio = max(m, k, n) / min(m, k, n)
+
+    if ratio <= SQUARE_RATIO:
+        return "strassen", 7, f"near-square (aspect ratio {ratio:.1f} <= {SQUARE_RATIO})"
+    if k >= SQUARE_RATIO * max(m, n):
+        return "inner", min(count, k), f"inner dimension dominates (k={k}, max(m, n)={max(m, n)})"
+    if m >= n:
+        return "rows", min(count, m), f"tall output (m={m} >= n={n}, k={k})"
+    return "cols", min(count, n), f"wide output (n={n} > m={m}, k={k})"
+
+def plan_strassen_tree(task, depth, result_dtype=None):
+    """Expand a MULTIPLY task breadth-first into a Job graph of at most depth levels"""
+    job = Job(task.job_id, depth, result_dtype)
+    job.nodes[task.task_id] = task
+    frontier = [task]
+    cutoff = max(cluster_dist_cutoff(), 1)
+
+    for _ in range(depth):
+        next_frontier = []
+        for node in frontier:
+            matrix_a, matrix_b = node.matrices
+            # Odd dimensions are peeled, but every dimension needs an even core to split;
+            # below the workers' distribution cutoff a node is computed in one piece anyway
+            if min(matrix_a.shape[0], matrix_a.shape[1], matrix_b.shape[1]) <= cutoff:
+                job.leaves.append(node)
+                continue
+
+            node.peel = peel_corrections(matrix_a, matrix_b) or None
+
+            children = []
+            for i, product in enumerate(strassen_products(matrix_a, matrix_b)):
+                # A product with a zero factor is known to be zero, so it never becomes a task
+                if is_zero_matrix(product[0]) or is_zero_matrix(product[1]):
+                    job.zero_slots.append((node.task_id, i) + product_shape(*product))
+                    continue
+                children.append(Task(
+                    task_type=TaskType.MULTIPLY,
+                    matrices=product,
+                    parent_id=node.task_id,
+                    m_number=i,
+                    job_id=node.job_id
+                ))
+            # Internal nodes only wait for their combine, so drop their operands
+            node.matrices = None
+            next_frontier.extend(job.add_children(node.task_id, children))
+        frontier = next_frontier
+
+    job.leaves.extend(frontier)
+    return job
+
+def register_worker(worker_id, worker_url, profile=None):
     """Register a worker node"""
-    with lock:
+    with workers_lock:
         workers[worker_id] = worker_url
-        print(f"Worker {worker_id} registered at {worker_url}")
+        worker_profiles[worker_id] = profile or {}
+        worker_seen[worker_id] = time.time()
+    print(f"Worker {worker_id} registered at {worker_url} {profile or ''}")
+    scheduler.add_worker(worker_id, worker_url, (profile or {}).get('weight', 1.0))
     return True
 
-def get_available_worker():
-    """Get an available worker (simple round-robin for now)"""
-    with lock:
-        if not workers:
-            return None
-        
-        # Get the first worker (could be enhanced with load balancing)
-        worker_id = list(workers.keys())[0]
-        worker_url = workers[worker_id]
-        
-        # Move this worker to the end of the dict for round-robin
-        workers.pop(worker_id)
-        workers[worker_id] = worker_url
-        
-        return worker_id, worker_url
+def cluster_winograd_levels():
+    """Most Strassen-Winograd levels any registered worker runs locally on float64 (see float64_exact)"""
+    with workers_lock:
+        profiles = list(worker_profiles.values())
+    levels = 0
+    for profile in profiles:
+        dist_cutoff = profile.get('dist_cutoff') or 1
+        blas_cutoff = (profile.get('blas_cutoffs') or {}).get('float64') or profile.get('blas_cutoff') or dist_cutoff
+        levels = max(levels, (max(dist_cutoff // max(blas_cutoff, 1), 1) - 1).bit_length())
+    return levels
+
+def cluster_dist_cutoff():
+    """Largest size no registered worker would distribute further, computing it locally or as one batched subtree (0 if none reported one)"""
+    with workers_lock:
+        cutoffs = [max(profile['dist_cutoff'], profile.get('batch_cutoff') or 0) for profile in worker_profiles.values() if profile.get('dist_cutoff')]
+    return min(cutoffs) if cutoffs else 0
+
+def is_local_worker(worker_id):
+    """Check whether a worker shares this node's SHM_DIR, so large matrices can skip HTTP"""
+    return is_local_peer(worker_profiles.get(worker_id, {}).get('shm_host'))
+
+def get_available_worker(task_id=None, nbytes=0, exclude=()):
+    """Pick a worker for a task with the configured scheduling policy, returning (worker_id, worker_url) or None"""
+    return scheduler.acquire(task_id, nbytes, exclude)
+
+def size_key(task):
+    """Key grouping tasks of the same type and operand shapes, whose run times are comparable"""
+    matrices = task.matrices if task.task_type in CONTENT_TASK_TYPES else (task.subtasks_results or [])[:1]
+    return (task.task_type.value,) + tuple(tuple(matrix.shape) for matrix in matrices or [])
+
+def lease_duration(task, worker_id):
+    """Seconds a worker gets to report a task, scaled to the task's estimated compute time"""
+    gops = worker_profiles.get(worker_id, {}).get('gops') or 1.0
+    if task.task_type in CONTENT_TASK_TYPES:
+        # A tile is the sum of its K-block pairs' products
+        ops = sum(2 * a.shape[0] * a.shape[1] * b.shape[1] for a, b in zip(task.matrices[::2], task.matrices[1::2]))
+    else:
+        ops = sum(matrix.size for matrix in task.subtasks_results or [])
+    return LEASE_MIN + LEASE_FACTOR * ops / (gops * 1e9)
+
+def grant_lease(task, worker_id, duration=None):
+    """Start the lease of a dispatched task, or add a worker to it for a backup copy
+
+    Without a duration the lease only ends if its workers disappear. Returns
+    False if the worker already held the lease.
+    """
+    with lease_lock:
+        lease = leases.get(task.task_id)
+        # A new task object under the same ID (its parent was split again) starts a fresh lease
+        if lease is None or lease.task is not task:
+            if duration is None:
+                duration = float("inf")
+            leases[task.task_id] = Lease(task, worker_id, duration)
+        elif worker_id not in lease.worker_ids:
+            lease.worker_ids.append(worker_id)
+        else:
+            return False
+    return True
+
+def revoke_lease(task, worker_id):
+    """Take a worker back off a task's lease after the send it was granted for failed, ending the lease if no other copy holds it"""
+    with lease_lock:
+        lease = leases.get(task.task_id)
+        if lease is None or lease.task is not task or worker_id not in lease.worker_ids:
+            return
+        lease.worker_ids.remove(worker_id)
+        if not lease.worker_ids:
+            del leases[task.task_id]
+
+def settle_task(task_id):
+    """Record that a dispatched task was reported: release its worker and end its lease"""
+    scheduler.release(task_id)
+    with lease_lock:
+        lease = leases.pop(task_id, None)
+        redispatches.pop(task_id, None)
+    job = jobs.get(lease.task.job_id) if lease is not None else None
+    if job is not None:
+        key = size_key(lease.task)
+        with job.lock:
+            job.durations.setdefault(key, []).append(time.time() - lease.started)
+
+def claim_products(parent_id, route, m_numbers):
+    """Record the products a split task handed back, returning those no earlier copy split under the same route handed back"""
+    with lease_lock:
+        split = split_tasks.get(parent_id)
+        if split is None or split[0] != route:
+            split = split_tasks[parent_id] = (route, set())
+        fresh = [m_number for m_number in m_numbers if m_number not in split[1]]
+        split[1].update(fresh)
+    return fresh
 
-def send_task_to_worker(worker_url, task):
-    """Send a task to a worker"""
+def register_task(task):
+    """Add a task to active_tasks, returning False if it must not be dispatched
+
+    Task IDs derive from the operands, so a MULTIPLY (or TILE) identical to one
+    already in flight is coalesced onto it instead: it waits in coalesced_tasks and
+    process_result fills its slot with the shared result.
+    """
+    with task_lock(task.task_id):
+        current = active_tasks.get(task.task_id)
+        if current is None or current is task or task.task_type not in CONTENT_TASK_TYPES:
+            active_tasks[task.task_id] = task
+            return True
+        coalesced_tasks.setdefault(task.task_id, []).append(task)
+
+    ops = sum(2 * a.shape[0] * a.shape[1] * b.shape[1] for a, b in zip(task.matrices[::2], task.matrices[1::2])) if task.matrices else 0
+    nbytes = task.nbytes() if task.matrices else 0
+    with coalesce_lock:
+        coalesce_stats['coalesced'] += 1
+        coalesce_stats['ops_saved'] += ops
+        coalesce_stats['bytes_saved'] += nbytes
+    count_job(task.job_id, coalesced=1)
+    print(f"Task {task.task_id} is already in flight, coalescing it")
+    return False
+
+def count_job(job_id, **counts):
+    """Add to the counters of a job that is still running"""
+    job = jobs.get(job_id)
+    if job is not None:
+        job.count(**counts)
+
+def record_wire(job_id, stats):
+    """Add the codec stats of a payload to its job"""
+    job = jobs.get(job_id) if stats else None
+    if job is not None:
+        with job.lock:
+            job.wire.update(stats)
+
+def send_task_to_worker(worker_url, task, shared=False):
+    """Send a task to a worker, returning (accepted, retry_after) where retry_after is set if the worker was busy"""
     try:
-        response = session.post(
-            f"{worker_url}/process",
-            json=task.to_dict(),
-            timeout=10,
-        )
-        return response.status_code == 200
+        stats = Counter()
+        response = send_task(session, f"{worker_url}/process", task, shared=shared, stats=stats, timeout=10)
+        record_wire(task.job_id, stats)
+        if response.status_code == 503:
+            return False, float(response.headers.get('Retry-After', 1))
+        return response.status_code == 200, None
     except Exception as e:
         print(f"Error sending task to worker: {e}")
-        return False
+        return False, None
+
+def task_priority(task):
+    """Queue priority of a task (lower is served first)
+
+    Combines go first: they finish work that is already paid for and free
+    the memory held by their inputs. Root tasks (whole jobs) come next, so a
+    small job is not stuck behind the leaves of a large one.
+    """
+    if task.task_type == TaskType.COMBINE:
+        return 0
+    return 1 if task.parent_id is None else 2
+
+def dispatch_task(task, exclude=()):
+    """Queue a task for a dispatcher thread to send to a worker (avoiding exclude if possible), or for workers to pull
+
+    A product already in the cache is reported at once instead. Routed tasks
+    are always sent, since their result must reach the combine worker.
+    """
+    if task.task_type in CONTENT_TASK_TYPES and not task.route:
+        cached = product_cache.get(task.task_id)
+        if cached is not None:
+            count_job(task.job_id, cached=1)
+            print(f"Answering task {task.task_id} from the product cache")
+            process_result(task.task_id, cached)
+            return
+
+    if DISPATCH_MODE == 'pull':
+        ready_queue.put(task, task_priority(task))
+        return
+
+    if not dispatchers:
+        start_dispatchers()
+    dispatch_queue.put(Dispatch(task, exclude), task_priority(task))
+
+def start_dispatchers():
+    """Start the threads sending queued tasks to workers, unless they are running"""
+    with dispatchers_lock:
+        while len(dispatchers) < max(DISPATCH_THREADS, 1):
+            thread = threading.Thread(target=dispatcher, daemon=True)
+            thread.start()
+            dispatchers.append(thread)
+
+def send_dispatch(dispatch):
+    """Send a queued task to the worker chosen by the scheduler
+
+    If every worker is busy (or none is registered), the task goes back in
+    the queue for a while instead of holding this thread.
+    """
+    task = dispatch.task
+    # Tasks dropped while queued (finished, failed or from a redone split) are not sent
+    if active_tasks.get(task.task_id) is not task or (task.job_id is not None and task.job_id not in jobs):
+        return
+
+    busy = set()
+    while True:
+        worker = get_available_worker(task.task_id, task.nbytes(), dispatch.exclude | busy | dispatch.unreachable)
+        if worker is None:
+            # Workers may be re-registering after missing heartbeats
+            requeue_dispatch(dispatch, 1, "No workers available")
+            return
+
+        worker_id, worker_url = worker
+        # The lease is in place before the send, so a result reported before
+        # the send returns settles it instead of finding nothing to settle
+        granted = grant_lease(task, worker_id, lease_duration(task, worker_id))
+        print(f"Sending task {task.task_id} to worker {worker_id}")
+        success, retry_after = send_task_to_worker(worker_url, task, is_local_worker(worker_id))
+        if success:
+            return
+        if granted:
+            revoke_lease(task, worker_id)
+        scheduler.release(task.task_id, completed=False, worker_id=worker_id)
+
+        # An unreachable worker is skipped; give up once the scheduler has no other left
+        if retry_after is None:
+            if worker_id in dispatch.unreachable:
+                break
+            dispatch.unreachable.add(worker_id)
+            continue
+
+        # A full worker asks to be retried later; try the others first, and
+        # only wait once the scheduler has nothing but busy workers left
+        if worker_id in busy:
+            requeue_dispatch(dispatch, retry_after, "All workers are busy")
+            return
+        busy.add(worker_id)
+
+    print(f"Failed to send task {task.task_id} to a worker")
+    fail_job(task.job_id, f"Failed to send task {task.task_id} to a worker")
+
+def requeue_dispatch(dispatch, delay, reason):
+    """Put a task that found no free worker back in the dispatch queue for delay seconds, failing its job after BUSY_RETRIES waits"""
+    task = dispatch.task
+    if dispatch.waits >= BUSY_RETRIES:
+        print(f"Failed to send task {task.task_id} to a worker")
+        fail_job(task.job_id, f"Failed to send task {task.task_id} to a worker")
+        return
+    dispatch.waits += 1
+    print(f"{reason}, retrying task {task.task_id} in {delay}s")
+    dispatch_queue.put(dispatch, task_priority(task), delay)
+
+def dispatcher():
+    """Send queued tasks to workers (push mode)"""
+    while True:
+        dispatch = dispatch_queue.get(1)
+        if dispatch is not None:
+            try:
+                send_dispatch(dispatch)
+            except Exception as e:
+                print(f"Error dispatching task {dispatch.task.task_id}: {e}")
+
+def fail_job(job_id, error):
+    """Mark a job as failed so waiting clients stop polling"""
+    job = jobs.get(job_id)
+    client_tasks.pop(job_id, None)
+    if job is not None:
+        # Stored before the job stops counting as running, so a waiting client never misses it
+        result_store.put(job_id, error=error, summary=job.describe())
+        jobs.pop(job_id, None)
+
+def fill_subtask_slot(parent_id, m_number, result):
+    """Store a subtask result for its parent, returning the follow-up step once all slots are in
+
+    The follow-up is ("combine", task) for a Strassen parent or
+    ("assemble", parent_id, kind, results, columns) for a block or tiled decomposition.
+    No lock is taken: see ResultSlots.
+    """
+    split = block_splits.get(parent_id)
+    slots = pending_results.get(parent_id)
+    if slots is None:
+        slots = pending_results.setdefault(parent_id, ResultSlots(split[1] if split else 7))  # 7 for Strassen
+
+    # A slot already filled by another copy of the same subtask keeps the first result
+    results = slots.fill(m_number, result)
+    if results is None:
+        return None
+
+    # Clean up
+    pending_results.pop(parent_id, None)
+
+    if split:
+        block_splits.pop(parent_id, None)
+        return ("assemble", parent_id, split[0], results, split[2])
+
+    # Create combine task
+    parent = active_tasks.get(parent_id)
+    combine_task = Task(
+        task_type=TaskType.COMBINE,
+        subtasks_results=results,
+        parent_id=parent_id,
+        job_id=parent.job_id if parent else None,
+        peel=parent.peel if parent else None
+    )
+
+    # Register the task
+    with task_lock(combine_task.task_id):
+        active_tasks[combine_task.task_id] = combine_task
+    return ("combine", combine_task)
+
+def run_follow_up(follow_up):
+    """Dispatch the combine task or assemble the blocks of a completed parent (without holding lock)"""
+    if follow_up is None:
+        return
+
+    if follow_up[0] == "combine":
+        # Send to an available worker in the background: the caller may be a
+        # worker reporting a result, which must not wait for a busy cluster
+        dispatch_task(follow_up[1])
+    else:
+        _, parent_id, kind, results, columns = follow_up
+        process_result(parent_id, assemble_blocks(kind, results, columns))
+
+def expire_leases():
+    """Drop silent workers, re-dispatch tasks whose lease ran out and back up stragglers near the end of their job"""
+    now = time.time()
+    with workers_lock:
+        dead = [worker_id for worker_id, seen in worker_seen.items() if now - seen > WORKER_TIMEOUT]
+        for worker_id in dead:
+            workers.pop(worker_id, None)
+            worker_profiles.pop(worker_id, None)
+            del worker_seen[worker_id]
+    for worker_id in dead:
+        print(f"Worker {worker_id} missed its heartbeats, removing it")
+
+    with lease_lock:
+        expired = []
+        for task_id, lease in list(leases.items()):
+            if now > lease.deadline or not any(worker_id in workers for worker_id in lease.worker_ids):
+                del leases[task_id]
+                expired.append(lease)
+
+        backups = []
+        if SPECULATE:
+            outstanding = {}
+            for lease in leases.values():
+                outstanding.setdefault(lease.task.job_id, []).append(lease)
+            for job_id, job_leases in outstanding.items():
+                job = jobs.get(job_id)
+                if job is None or len(job_leases) > SPECULATE_TAIL:
+                    continue
+                for lease in job_leases:
+                    peers = sorted(job.durations.get(size_key(lease.task), []))
+                    # A routed combine has no deadline: it waits on its whole split, so it is never a straggler
+                    if lease.speculated or lease.deadline == float("inf") or len(peers) < SPECULATE_MIN_SAMPLES:
+                        continue
+                    if now - lease.started > SPECULATE_FACTOR * peers[len(peers) // 2]:
+                        lease.speculated = True
+                        backups.append(lease)
+
+    for lease in backups:
+        count_job(lease.task.job_id, speculated=1)
+
+    for worker_id in dead:
+        scheduler.remove_worker(worker_id)
+
+    for lease in expired:
+        task = lease.task
+        scheduler.release(task.task_id, completed=False)
+        with lease_lock:
+            attempts = redispatches[task.task_id] = redispatches.get(task.task_id, 0) + 1
+            # A split must be redone in full (e.g. its routed combine worker died)
+            split_tasks.pop(task.task_id, None)
+        if active_tasks.get(task.task_id) is not task:
+            continue
+        drop_routed_split(task.task_id)
+        count_job(task.job_id, redispatched=1)
+        if attempts > MAX_REDISPATCH:
+            fail_job(task.job_id, f"Task {task.task_id} was not completed after {attempts} attempts")
+            continue
+        print(f"Lease of task {task.task_id} expired on worker(s) {', '.join(lease.worker_ids)}, dispatching it again")
+        dispatch_task(task, lease.worker_ids)
+
+    for lease in backups:
+        print(f"Task {lease.task.task_id} is a straggler on worker(s) {', '.join(lease.worker_ids)}, dispatching a backup copy")
+        dispatch_task(lease.task, lease.worker_ids)
+
+def drop_routed_split(parent_id):
+    """Stop tracking the children of a routed split that must be redone, and their own routed splits
+
+    Only the new split's children are waited for: copies of the old ones
+    still running report to a task ID the coordinator no longer knows.
+    """
+    with lease_lock:
+        stale = routed_splits.pop(parent_id, [])
+        for task_id in stale:
+            leases.pop(task_id, None)
+            redispatches.pop(task_id, None)
+            split_tasks.pop(task_id, None)
+    if not stale:
+        return
+
+    print(f"Dropping {len(stale)} tasks of the previous split of task {parent_id}")
+    for task_id in stale:
+        with task_lock(task_id):
+            active_tasks.pop(task_id, None)
+            coalesced_tasks.pop(task_id, None)
+        pending_results.pop(task_id, None)
+        scheduler.release(task_id, completed=False)
+        drop_routed_split(task_id)
+
+def lease_monitor():
+    """Check leases and heartbeats in the background"""
+    while True:
+        time.sleep(LEASE_CHECK_INTERVAL)
+        try:
+            expire_leases()
+        except Exception as e:
+            print(f"Error checking leases: {e}")
+
+def resolve_zero_subtask(parent_id, m_number, shape, dtype, job_id):
+    """Fill a subtask slot with zeros instead of dispatching a product with a zero factor"""
+    count_job(job_id, skipped=1)
+    run_follow_up(fill_subtask_slot(parent_id, m_number, np.zeros(shape, dtype=dtype)))
 
 def process_result(task_id, result):
     """Process a completed task result"""
-    with lock:
-        if task_id not in active_tasks:
-            print(f"Received result for unknown task: {task_id}={result}")
+    # Taking the task and the tasks coalesced onto it in one step means a task
+    # registered later is either among them or starts a fresh one
+    with task_lock(task_id):
+        task = active_tasks.pop(task_id, None)
+        recipients = [task] + coalesced_tasks.pop(task_id, []) if task is not None else []
+
+    if task is None:
+        print(f"Received result for unknown task: {task_id}")
+        return
+
+    with lease_lock:
+        split_tasks.pop(task_id, None)
+        routed_splits.pop(task_id, None)
+
+    # Identical tasks coalesced onto this one share its result
+    if len(recipients) > 1:
+        with coalesce_lock:
+            coalesce_stats['fanned_out'] += len(recipients) - 1
+        print(f"Fanning out the result of task {task_id} to {len(recipients)} slots")
+
+    if task.task_type in CONTENT_TASK_TYPES:
+        product_cache.put(task_id, result)
+
+    # A routed task combined here (its own split could not be routed) still
+    # owes its result to the worker collecting its parent's split
+    if task.route:
+        deliver_routed(task, result)
+        return
+
+    # Subtasks update their parents' results
+    follow_ups = [fill_subtask_slot(recipient.parent_id, recipient.m_number, result) for recipient in recipients if recipient.parent_id]
+
+    if any(recipient.parent_id is None for recipient in recipients):
+        # This is a top-level task
+        finish_job(task_id, result)
+
+    #logic moved to prevent deadlocking
+    for follow_up in follow_ups:
+        run_follow_up(follow_up)
+
+def deliver_routed(task, result):
+    """Send the result of a routed task to the worker collecting its parent's split
+
+    If that worker is gone, its lease on the parent expires and the parent's
+    split is redone, so a failed delivery is only logged.
+    """
+    route = task.route
+    try:
+        stats = Counter()
+        response = post_matrices(session, f"{route['url']}/deliver", {'slot': route['slot'], 'm_number': route['m_number']}, [result], ['result'],
+                                 shared=is_local_peer(route.get('shm_host')), stats=stats, timeout=(5, 10))
+        record_wire(task.job_id, stats)
+        if response.status_code == 200:
             return
-        
-        task = active_tasks[task_id]
-
-        parent_id = task.parent_id
-
-        combine_task_generated = False
-        
-        
-        if parent_id:
-            # This is a subtask, update the parent task's results
-            if parent_id not in pending_results:
-                pending_results[parent_id] = [0, [None] * 7]
-            
-            # Find the position of this subtask in the parent's pending results
-            pending_results[parent_id][1][task.m_number] = result
-            pending_results[parent_id][0] += 1
-            # Check if all subtasks are complete
-            if pending_results[parent_id][0] == 7:  # 7 for Strassen
-                # Create combine task
-                all_results = pending_results[parent_id][1]
-                combine_task = Task(
-                    task_type=TaskType.COMBINE,
-                    subtasks_results=all_results,
-                    parent_id=parent_id
-                )
-                
-                # Clean up
-                del pending_results[parent_id]
-
-                # Register the task
-                active_tasks[combine_task.task_id] = combine_task
-                combine_task_generated = True
-                
-                
-        else:
-            # This is a top-level task
-            if task_id in client_tasks:
-                # Unpad the result if needed
-                original_shapes = client_tasks[task_id]
-                if original_shapes:
-                    result = unpad_matrix(result, original_shapes[0], original_shapes[1])
-                
-                print(f"Final result for task {task_id}:\n{result}")
-                print(result.tolist())
-                with open("/app/data/results.txt", 'w') as f:
-                    f.write(";\n".join(" ".join(str(y) for y in x) for x in result.tolist()))
+        print(f"Worker at {route['url']} refused the result of task {task.task_id}: {response.status_code}")
+    except Exception as e:
+        print(f"Error delivering result of task {task.task_id} to {route['url']}: {e}")
+
+def finish_job(job_id, result):
+    """Unpad and cast a job's final result, then hand it to the result store and the result sink"""
+    # Unpad the result if needed
+    original_shapes = client_tasks.pop(job_id, None)
+    if original_shapes:
+        result = unpad_matrix(result, original_shapes[0], original_shapes[1])
 
-                # Clean up
-                del client_tasks[task_id]
-            
-        # Remove completed task
-        del active_tasks[task_id]
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    if job.result_dtype is not None:
+        result = cast_result(result, job.result_dtype)
 
-    if combine_task_generated: #logic moved to prevent deadlocking
-        # Send to an available worker
-        worker_id, worker_url = get_available_worker()
-        print(f"Sending combine task {combine_task.task_id} to worker {worker_id}")
-        send_task_to_worker(worker_url, combine_task)
+    print(f"Final result for task {job_id}:\n{result}")
+    print(f"Job {job_id} finished in {time.time() - job.submitted_at:.3f}s ({job.describe()})")
+
+    # Stored before the job stops counting as running, so a waiting client never misses it
+    result_store.put(job_id, result=result, summary=job.describe())
+    jobs.pop(job_id, None)
+    result_sink.put(job_id, result)
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -133,86 +947,324 @@ def register():
     
     if not worker_id or not worker_url:
         return jsonify({'error': 'Missing worker ID or URL'}), 400
-    
-    register_worker(worker_id, worker_url)
-    return jsonify({'status': 'registered'}), 200
+
+    profile = {key: data[key] for key in ('dist_cutoff', 'batch_cutoff', 'blas_cutoff', 'blas_cutoffs', 'gops', 'bandwidth', 'latency', 'weight', 'shm_host') if key in data}
+    register_worker(worker_id, worker_url, profile)
+    return jsonify({'status': 'registered', 'dispatch_mode': DISPATCH_MODE, 'shm_host': shm_host_id()}), 200
+
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Endpoint for workers to show they are alive (404 tells a dropped worker to register again)"""
+    worker_id = (request.get_json() or {}).get('worker_id')
+    with workers_lock:
+        known = worker_id in workers
+        if known:
+            worker_seen[worker_id] = time.time()
+    if not known:
+        return jsonify({'error': 'Unknown worker'}), 404
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/workers', methods=['GET'])
+def list_workers():
+    """Endpoint listing registered workers with their reported cutoffs"""
+    now = time.time()
+    with workers_lock:
+        listing = {
+            worker_id: {'url': url, 'last_seen': now - worker_seen.get(worker_id, now), **worker_profiles.get(worker_id, {})}
+            for worker_id, url in workers.items()
+        }
+    return jsonify(listing), 200
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_stats():
+    """Endpoint exposing the scheduling policy and per-worker load counters"""
+    stats = scheduler.stats()
+    stats['dispatch_mode'] = DISPATCH_MODE
+    stats['ready'] = (ready_queue if DISPATCH_MODE == 'pull' else dispatch_queue).depths()
+    return jsonify(stats), 200
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """Endpoint exposing the product cache counters"""
+    return jsonify(product_cache.stats()), 200
+
+@app.route('/coalescing', methods=['GET'])
+def coalescing_stats():
+    """Endpoint exposing how much work coalescing identical tasks saved"""
+    with coalesce_lock:
+        stats = dict(coalesce_stats)
+    stats['waiting'] = sum(len(tasks) for tasks in list(coalesced_tasks.values()))
+    return jsonify(stats), 200
+
+@app.route('/next', methods=['GET'])
+def next_task():
+    """Endpoint for workers to pull their next task, held open until one is ready (pull mode)"""
+    worker_id = request.args.get('worker_id')
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_PULL_WAIT)
+    if not worker_id:
+        return jsonify({'error': 'Missing worker ID'}), 400
+
+    task = ready_queue.get(wait)
+    # Tasks dropped while queued (finished or from a redone split) are skipped
+    while task is not None and active_tasks.get(task.task_id) is not task:
+        task = ready_queue.get(0)
+    if task is None:
+        return '', 204
+
+    scheduler.assign(task.task_id, worker_id, task.nbytes())
+    grant_lease(task, worker_id, lease_duration(task, worker_id))
+    print(f"Worker {worker_id} pulled task {task.task_id}")
+    stats = Counter()
+    body, content_type = encode_task_response(request, task, stats)
+    record_wire(task.job_id, stats)
+    return Response(body, mimetype=content_type)
+
+@app.route('/probe', methods=['POST'])
+def probe():
+    """Endpoint workers post dummy payloads to when measuring network bandwidth"""
+    return jsonify({'bytes': len(request.get_data())}), 200
 
 @app.route('/submit', methods=['POST'])
 def submit_task():
     """Endpoint for clients to submit matrix multiplication tasks"""
-    data = request.json
-    matrix_a = np.array(data.get('matrix_a', []))
-    matrix_b = np.array(data.get('matrix_b', []))
+    stats = Counter()
+    try:
+        data, (matrix_a, matrix_b) = read_payload(request, ['matrix_a', 'matrix_b'], stats)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
     
-    if matrix_a.size == 0 or matrix_b.size == 0:
+    if matrix_a.ndim != 2 or matrix_b.ndim != 2 or matrix_a.size == 0 or matrix_b.size == 0:
         return jsonify({'error': 'Invalid matrices'}), 400
     
     if matrix_a.shape[1] != matrix_b.shape[0]:
         return jsonify({'error': 'Incompatible matrix dimensions'}), 400
+
+    # Every task of the job computes in one dtype, which padding, splitting and the wire all preserve
+    try:
+        compute_dtype, result_dtype = compute_dtypes(matrix_a, matrix_b, ACCUMULATE, cluster_winograd_levels())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    matrix_a = matrix_a.astype(compute_dtype, copy=False)
+    matrix_b = matrix_b.astype(compute_dtype, copy=False)
+    print(f"Computing in {compute_dtype} for a {result_dtype} result")
+
+    # Choose how to decompose the job from its shape
+    (m, k), n = matrix_a.shape, matrix_b.shape[1]
+    kind = data.get('decomposition', 'auto' if SHAPE_PLANNER else 'strassen')
+    if kind == 'auto' and SPARSE_CUTOFF > 0:
+        sparsest = min(density(matrix_a), density(matrix_b))
+        if sparsest <= SPARSE_CUTOFF:
+            kind = 'sparse'
+            print(f"Decomposition for {m}x{k} @ {k}x{n}: sparse (density {sparsest:.4f} <= {SPARSE_CUTOFF})")
+    if kind == 'auto':
+        with workers_lock:
+            num_workers = len(workers)
+        kind, count, reason = choose_decomposition(m, k, n, num_workers)
+        print(f"Decomposition for {m}x{k} @ {k}x{n}: {kind} ({reason})")
+    elif kind in ('rows', 'cols', 'inner'):
+        count = min(BLOCK_COUNT or max(len(workers), 1), {'rows': m, 'cols': n, 'inner': k}[kind])
+        print(f"Decomposition for {m}x{k} @ {k}x{n}: {kind} (requested)")
+    elif kind not in ('strassen', 'sparse', 'tiles'):
+        return jsonify({'error': f'Unknown decomposition: {kind}'}), 400
+
+    # A single block is the whole job, so it would just be the same task again
+    if kind in ('rows', 'cols', 'inner') and count < 2:
+        print(f"Only one {kind} block, using strassen instead")
+        kind = 'strassen'
+
+    if kind in ('rows', 'cols', 'inner', 'tiles'):
+        task = Task(
+            task_type=TaskType.MULTIPLY,
+            matrices=[matrix_a, matrix_b]
+        )
+        task.job_id = task.task_id
+        if kind == 'tiles':
+            # Tiles need no padding or combines: the coordinator only assembles them
+            return submit_tile_task(task, result_dtype, stats)
+        return submit_block_task(task, kind, count, result_dtype, stats)
     
-    # Pad matrices for Strassen if needed
-    padded_a, padded_b, original_a_shape, original_b_shape = pad_matrices(matrix_a, matrix_b)
+    if kind == 'sparse' or data.get('padding', PADDING_MODE) == 'peel':
+        # Odd dimensions are peeled off at every level, so nothing needs padding or unpadding
+        padded_a, padded_b = matrix_a, matrix_b
+        original_shapes = None
+    else:
+        # Pad matrices for Strassen if needed
+        padded_a, padded_b, original_a_shape, original_b_shape = pad_matrices(matrix_a, matrix_b)
+        original_shapes = (original_a_shape, original_b_shape)
     
     # Create the task
     task = Task(
         task_type=TaskType.MULTIPLY,
         matrices=[padded_a, padded_b]
     )
-    
-    # Register the task
-    with lock:
-        active_tasks[task.task_id] = task
-        client_tasks[task.task_id] = (original_a_shape, original_b_shape)
+    task.job_id = task.task_id
 
+    # A sparse job is one task: the worker multiplies it whole, and its padding would only add work
+    depth = 0 if kind == 'sparse' else int(data.get('planner_depth', PLANNER_DEPTH))
+    if depth > 0:
+        return submit_planned_task(task, original_shapes, depth, result_dtype, stats)
     
+    # Register the task
+    job = Job(task.task_id, result_dtype=result_dtype)
+    job.decomposition = kind
+    job.wire.update(stats)
+    client_tasks[task.task_id] = original_shapes
+    jobs[task.task_id] = job
+    dispatch = register_task(task)
     
-    # Get an available worker
-    worker_id, worker_url = get_available_worker()
-    if worker_id is None:
-        return jsonify({'error': 'No workers available'}), 503
-    
-    print(f"Sending task {task.task_id} to worker {worker_id}")
-    success = send_task_to_worker(worker_url, task)
-    
-    if not success:
-        return jsonify({'error': 'Failed to send task to worker'}), 500
+    # Send (or queue) the task for a worker
+    if dispatch:
+        dispatch_task(task)
     
     return jsonify({
         'task_id': task.task_id,
         'status': 'submitted'
     }), 200
 
+def submit_planned_task(task, original_shapes, depth, result_dtype=None, stats=None):
+    """Expand a client task into its Strassen graph and dispatch every leaf at once (stats: codec stats of the submission)"""
+    with workers_lock:
+        if not workers:
+            return jsonify({'error': 'No workers available'}), 503
+
+    job = plan_strassen_tree(task, depth, result_dtype)
+    job.wire.update(stats or {})
+
+    # Register the whole graph before any leaf can report back
+    client_tasks[task.task_id] = original_shapes
+    jobs[task.task_id] = job
+    coalesced = [node for node in list(job.nodes.values()) + job.duplicates if not register_task(node)]
+
+    for parent_id, m_number, shape, dtype in job.zero_slots:
+        resolve_zero_subtask(parent_id, m_number, shape, dtype, job.job_id)
+
+    print(f"Planned task {task.task_id}: {job.describe()}")
+    for leaf in job.leaves:
+        if leaf not in coalesced:
+            dispatch_task(leaf)
+    
+    return jsonify({
+        'task_id': task.task_id,
+        'status': 'submitted',
+        'leaves': len(job.leaves)
+    }), 200
+
+def submit_block_task(task, kind, count, result_dtype=None, stats=None):
+    """Split a client task into row, column or inner-dimension blocks and dispatch them at once (stats: codec stats of the submission)"""
+    operands = block_products(*task.matrices, kind, count)
+    return submit_split_task(task, TaskType.MULTIPLY, operands, (kind, count, None), f"{kind} x{count}", result_dtype, stats)
+
+def submit_tile_task(task, result_dtype=None, stats=None):
+    """Cut a client task into a grid of TILE tasks (SUMMA-style), each accumulating one tile of C over the K-blocks"""
+    with workers_lock:
+        num_workers = len(workers)
+    (m, k), n = task.matrices[0].shape, task.matrices[1].shape[1]
+    rows, cols = tile_grid(m, n, BLOCK_COUNT or max(num_workers, 1))
+    k_blocks = min(k, -(-k // TILE_K_BLOCK)) if TILE_K_BLOCK > 0 else 1
+    print(f"Tiling {m}x{k} @ {k}x{n} into {rows}x{cols} tiles of {k_blocks} K-blocks")
+
+    operands = tile_products(*task.matrices, rows, cols, k_blocks)
+    return submit_split_task(task, TaskType.TILE, operands, ("tiles", rows * cols, cols), f"tiles {rows}x{cols}x{k_blocks}", result_dtype, stats)
+
+def submit_split_task(task, task_type, operands, split, label, result_dtype=None, stats=None):
+    """Register a client task split into independent children of task_type and dispatch them at once
+
+    operands holds the matrices of each child; split is the (kind, count,
+    columns) entry of block_splits telling assemble_blocks how to join the
+    children's results, and label names the decomposition in the job summary.
+    """
+    with workers_lock:
+        if not workers:
+            return jsonify({'error': 'No workers available'}), 503
+
+    job = Job(task.job_id, depth=1, result_dtype=result_dtype)
+    job.decomposition = label
+    job.wire.update(stats or {})
+    job.nodes[task.task_id] = task
+
+    children = []
+    for i, matrices in enumerate(operands):
+        # A child is zero when every one of its products has a zero factor
+        if all(is_zero_matrix(a) or is_zero_matrix(b) for a, b in zip(matrices[::2], matrices[1::2])):
+            job.zero_slots.append((task.task_id, i) + product_shape(matrices[0], matrices[1]))
+            continue
+        children.append(Task(
+            task_type=task_type,
+            matrices=matrices,
+            parent_id=task.task_id,
+            m_number=i,
+            job_id=task.job_id
+        ))
+    job.leaves = job.add_children(task.task_id, children)
+
+    # The root only waits for its children, so drop its operands
+    task.matrices = None
+
+    client_tasks[task.task_id] = None
+    jobs[task.task_id] = job
+    block_splits[task.task_id] = split
+    coalesced = [node for node in list(job.nodes.values()) + job.duplicates if not register_task(node)]
+
+    for parent_id, m_number, shape, dtype in job.zero_slots:
+        resolve_zero_subtask(parent_id, m_number, shape, dtype, job.job_id)
+
+    print(f"Planned task {task.task_id}: {job.describe()}")
+    for leaf in job.leaves:
+        if leaf not in coalesced:
+            dispatch_task(leaf)
+
+    return jsonify({
+        'task_id': task.task_id,
+        'status': 'submitted',
+        'decomposition': split[0],
+        'leaves': len(job.leaves)
+    }), 200
+
 @app.route('/return', methods=['POST'])
 def return_task():
     """Endpoint for workers to submit matrix multiplication subtasks"""
-    data = request.json
-    matrix_a = np.array(data.get('matrix_a', []))
-    matrix_b = np.array(data.get('matrix_b', []))
+    stats = Counter()
+    try:
+        data, matrices = read_payload(request, ['matrix_a', 'matrix_b'], stats)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
     parent_id = data.get('parent_id')
     m_number = data.get('m_number')
+    job_id = data.get('job_id')
+    record_wire(job_id, stats)
+
+    # The worker has handed the split task's work back; a product another
+    # copy of the task already handed back (under the same route) is ignored
+    settle_task(parent_id)
+    parent = active_tasks.get(parent_id)
+    if not claim_products(parent_id, parent.route if parent else None, [m_number]):
+        return jsonify({'status': 'duplicate'}), 200
+
+    # Products with a zero factor resolve immediately without a dispatch
+    if data.get('zero_shape'):
+        resolve_zero_subtask(parent_id, m_number, tuple(data['zero_shape']), data.get('zero_dtype', 'int32'), job_id)
+        return jsonify({'status': 'skipped'}), 200
+
+    matrix_a, matrix_b = matrices
+    if is_zero_matrix(matrix_a) or is_zero_matrix(matrix_b):
+        resolve_zero_subtask(parent_id, m_number, *product_shape(matrix_a, matrix_b), job_id)
+        return jsonify({'status': 'skipped'}), 200
     
     # Create the task
     task = Task(
         task_type=TaskType.MULTIPLY,
         matrices=[matrix_a, matrix_b],
         parent_id=parent_id,
-        m_number=m_number
+        m_number=m_number,
+        job_id=job_id
     )
     
     # Register the task
-    with lock:
-        active_tasks[task.task_id] = task    
-    
-    # Get an available worker
-    worker_id, worker_url = get_available_worker()
-    if worker_id is None:
-        return jsonify({'error': 'No workers available'}), 503
+    dispatch = register_task(task)
     
-    print(f"Sending task {task.task_id} to worker {worker_id}")
-    success = send_task_to_worker(worker_url, task)
-    
-    if not success:
-        return jsonify({'error': 'Failed to send task to worker'}), 500
+    # Send (or queue) the task without holding up the worker; a failed send fails the job
+    if dispatch:
+        dispatch_task(task)
     
     return jsonify({
         'task_id': task.task_id,
@@ -220,21 +1272,259 @@ def return_task():
     }), 200
 
 
+def route_to_combiner(parent_id, job_id, tasks, zero_slots):
+    """Have a worker collect the results of a split directly, returning False to fall back to the coordinator
+
+    The chosen worker is told about the split (its zero products, peel
+    corrections and where its own result goes) before any subtask is
+    dispatched, and each subtask is pointed at it.
+    """
+    parent = active_tasks.get(parent_id)
+    if parent is None:
+        return False
+    peel = parent.peel
+    next_route = parent.route
+    # The combine is counted against the chosen worker until the split's result is reported
+    nbytes = sum(task.nbytes() // 2 for task in tasks)
+    worker = get_available_worker(parent_id, nbytes)
+    if worker is None:
+        return False
+    worker_id, worker_url = worker
+
+    peel = peel or {}
+    meta = {
+        'slot': parent_id,
+        'job_id': job_id,
+        'next_route': next_route,
+        'zeros': [{'m_number': m_number, 'zero_shape': list(shape), 'zero_dtype': str(dtype)} for m_number, shape, dtype in zero_slots],
+        'peel_keys': list(peel.keys())
+    }
+    try:
+        stats = Counter()
+        response = post_matrices(session, f"{worker_url}/expect", meta, list(peel.values()), list(peel.keys()), shared=is_local_worker(worker_id), stats=stats, timeout=10)
+        record_wire(job_id, stats)
+        if response.status_code != 200:
+            scheduler.release(parent_id, completed=False, worker_id=worker_id)
+            return False
+    except Exception as e:
+        print(f"Error announcing combine to worker {worker_id}: {e}")
+        scheduler.release(parent_id, completed=False, worker_id=worker_id)
+        return False
+
+    # The combine waits on the whole split, so it has no deadline; it is only
+    # re-run (by splitting the parent again) if the combine worker disappears
+    grant_lease(parent, worker_id)
+    print(f"Routing results of task {parent_id} to worker {worker_id}")
+    epoch = next(route_epochs)
+    for task in tasks:
+        # A routed result goes to this split's combine worker and cannot be
+        # shared, so the task gets an ID no identical task elsewhere can have
+        task.task_id = f"{task.task_id}~{epoch}.{task.m_number}"
+        task.route = {'url': worker_url, 'slot': parent_id, 'm_number': task.m_number, 'epoch': epoch, 'shm_host': worker_profiles.get(worker_id, {}).get('shm_host')}
+    with lease_lock:
+        routed_splits[parent_id] = [task.task_id for task in tasks]
+
+    count_job(job_id, skipped=len(zero_slots))
+    return True
+
+@app.route('/return_batch', methods=['POST'])
+def return_batch():
+    """Endpoint for workers to submit all 7 Strassen subtasks of a split in one request"""
+    stats = Counter()
+    try:
+        data, matrices = read_payload(request, BATCH_KEYS, stats)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
+    parent_id = data.get('parent_id')
+    job_id = data.get('job_id')
+    record_wire(job_id, stats)
+    products = data.get('products', [])
+    peel_keys = data.get('peel_keys', [])
+
+    operand_count = 2 * sum(1 for product in products if not product.get('zero_shape'))
+    if not parent_id or len(matrices) != operand_count + len(peel_keys):
+        return jsonify({'error': 'Invalid subtask batch'}), 400
+
+    # The worker has handed the split task's work back. A second copy of the
+    # task (re-dispatched or speculative) splitting it again changes nothing,
+    # unless the task was re-sent with a new route because its parent's split
+    # had to be redone
+    settle_task(parent_id)
+    parent = active_tasks.get(parent_id)
+    if not claim_products(parent_id, parent.route if parent else None, [product['m_number'] for product in products]):
+        return jsonify({'task_ids': [], 'skipped': 0, 'status': 'duplicate'}), 200
+
+    # Corrections must be attached before any product can complete
+    if peel_keys and parent is not None:
+        parent.peel = dict(zip(peel_keys, matrices[operand_count:]))
+
+    tasks = []
+    zero_slots = []
+    operands = iter(matrices[:operand_count])
+    for product in products:
+        m_number = product['m_number']
+
+        # Products with a zero factor resolve immediately without a dispatch
+        if product.get('zero_shape'):
+            zero_slots.append((m_number, tuple(product['zero_shape']), product.get('zero_dtype', 'int32')))
+            continue
+
+        matrix_a, matrix_b = next(operands), next(operands)
+        if is_zero_matrix(matrix_a) or is_zero_matrix(matrix_b):
+            zero_slots.append((m_number,) + product_shape(matrix_a, matrix_b))
+            continue
+
+        tasks.append(Task(
+            task_type=TaskType.MULTIPLY,
+            matrices=[matrix_a, matrix_b],
+            parent_id=parent_id,
+            m_number=m_number,
+            job_id=job_id
+        ))
+
+    routed = ROUTING == 'direct' and route_to_combiner(parent_id, job_id, tasks, zero_slots)
+
+    # Register the whole batch before any of it is dispatched
+    dispatched = [task for task in tasks if register_task(task)]
+
+    if not routed:
+        for m_number, shape, dtype in zero_slots:
+            resolve_zero_subtask(parent_id, m_number, shape, dtype, job_id)
+
+    # Send the subtasks concurrently without holding up the worker, whose
+    # executor slot may be needed to run them; a failed send fails the job
+    for task in dispatched:
+        dispatch_task(task)
+
+    return jsonify({
+        'task_ids': [task.task_id for task in tasks],
+        'skipped': len(zero_slots),
+        'status': 'returned'
+    }), 200
+
+@app.route('/peel', methods=['POST'])
+def receive_peel():
+    """Endpoint for workers to attach odd row/column corrections to a task they split"""
+    stats = Counter()
+    try:
+        data, matrices = read_payload(request, PEEL_KEYS, stats)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
+    task_id = data.get('task_id')
+    keys = data.get('peel_keys', [])
+
+    if len(keys) != len(matrices):
+        return jsonify({'error': 'Invalid peel data'}), 400
+
+    task = active_tasks.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    task.peel = dict(zip(keys, matrices))
+
+    record_wire(task.job_id, stats)
+
+    return jsonify({'status': 'received'}), 200
+
 @app.route('/result', methods=['POST'])
 def receive_result():
     """Endpoint for workers to submit results"""
-    data = request.json
+    stats = Counter()
+    try:
+        data, (result,) = read_payload(request, ['result'], stats)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
     task_id = data.get('task_id')
-    result = np.array(data.get('result', []))
     
     if not task_id or result.size == 0:
         return jsonify({'error': 'Invalid result data'}), 400
+
+    # A combine reports its parent's result under the parent's ID; source_id names the task that ran
+    source_id = data.get('source_id', task_id)
+    settle_task(source_id)
+    source = active_tasks.get(source_id)
+    if source_id != task_id:
+        with task_lock(source_id):
+            active_tasks.pop(source_id, None)
+    if source is not None:
+        record_wire(source.job_id, stats)
     
     process_result(task_id, result)
     return jsonify({'status': 'received'}), 200
 
+@app.route('/complete', methods=['POST'])
+def complete_tasks():
+    """Endpoint for workers to report routed tasks whose results went to another worker"""
+    task_ids = (request.get_json() or {}).get('task_ids', [])
+    for task_id in task_ids:
+        with task_lock(task_id):
+            active_tasks.pop(task_id, None)
+        with lease_lock:
+            split_tasks.pop(task_id, None)
+            routed_splits.pop(task_id, None)
+        settle_task(task_id)
+    return jsonify({'status': 'received'}), 200
+
+@app.route('/jobs/<task_id>', methods=['GET'])
+def job_status(task_id):
+    """Endpoint for clients to check the status of a submitted job"""
+    job = jobs.get(task_id)
+    if job is not None:
+        return jsonify({
+            'task_id': task_id,
+            'status': 'running',
+            'elapsed': time.time() - job.submitted_at,
+            'summary': job.describe()
+        }), 200
+
+    entry = result_store.get(task_id)
+    if entry is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+
+    status = {
+        'task_id': task_id,
+        'status': entry['status'],
+        'summary': entry['summary']
+    }
+    if entry['error']:
+        status['error'] = entry['error']
+    if entry['result'] is not None:
+        status['shape'] = list(entry['result'].shape)
+        status['dtype'] = entry['result'].dtype.str
+    return jsonify(status), 200
+
+@app.route('/jobs/<task_id>/result', methods=['GET'])
+def job_result(task_id):
+    """Endpoint for clients to download a result, long-polling up to ?wait= seconds"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = float('nan')
+    if np.isnan(wait):
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    wait = min(max(wait, 0.0), MAX_RESULT_WAIT)
+
+    def is_running(job_id):
+        return job_id in jobs
+
+    entry = result_store.wait(task_id, wait, is_running)
+    if entry is None:
+        if is_running(task_id):
+            return jsonify({'task_id': task_id, 'status': 'running'}), 202
+        return jsonify({'error': 'Unknown or expired job'}), 404
+
+    if entry['error']:
+        return jsonify({'task_id': task_id, 'status': 'failed', 'error': entry['error']}), 500
+
+    body, content_type = encode_response(request, {'task_id': task_id}, [entry['result']], ['result'])
+    return Response(body, content_type=content_type)
+
 if __name__ == '__main__':
     print(f"Starting coordinator node (ID: {NODE_ID}) on port {PORT}")
+
+    # Re-dispatch tasks of failed or slow workers
+    threading.Thread(target=lease_monitor, daemon=True).start()
+    # Write finished results to RESULT_DIR
+    threading.Thread(target=result_sink.run, daemon=True).start()
     
     # Start the Flask application
     app.run(host='0.0.0.0', port=PORT, threaded=True, debug=False)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+
+POLICIES = ("round_robin", "least_loaded", "p2c")
+
+class WorkerLoad:
+    """Dispatch accounting for one worker"""
+    def __init__(self, worker_id, url, weight=1.0):
+        self.worker_id = worker_id
+        self.url = url
+        self.weight = weight if weight and weight > 0 else 1.0
+        self.in_flight = 0  # Tasks sent and not yet reported back
+        self.bytes_in_flight = 0  # Payload bytes of those tasks
+        self.dispatched = 0
+        self.completed = 0
+        self.bytes_sent = 0
+
+    def load(self, nbytes=0):
+        """Outstanding work after adding a task of nbytes, relative to the worker's weight"""
+        return ((self.bytes_in_flight + nbytes) / self.weight, (self.in_flight + 1) / self.weight)
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'weight': self.weight,
+            'in_flight': self.in_flight,
+            'bytes_in_flight': self.bytes_in_flight,
+            'dispatched': self.dispatched,
+            'completed': self.completed,
+            'bytes_sent': self.bytes_sent
+        }
+
+class Scheduler:
+    """Picks the worker for each task and tracks what every worker has in flight
+
+    Policies:
+      round_robin  : rotate through the workers regardless of load
+      least_loaded : the worker with the fewest outstanding bytes per unit of weight
+      p2c          : the less loaded of two workers sampled at random (power of two choices)
+    """
+    def __init__(self, policy="least_loaded"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.workers = {}  # Map worker_id to WorkerLoad
+        self.order = []  # Worker ids in registration order, for round robin
+        self.next_index = 0
+        self.assignments = {}  # Map task_id to [(worker_id, nbytes), ...] (one per copy) until the task is released
+        self.lock = threading.Lock()
+
+    def add_worker(self, worker_id, url, weight=1.0):
+        """Register a worker, or update the URL and weight of a known one"""
+        with self.lock:
+            if worker_id in self.workers:
+                self.workers[worker_id].url = url
+                self.workers[worker_id].weight = weight if weight and weight > 0 else 1.0
+            else:
+                self.workers[worker_id] = WorkerLoad(worker_id, url, weight)
+                self.order.append(worker_id)
+
+    def remove_worker(self, worker_id):
+        """Stop scheduling onto a worker"""
+        with self.lock:
+            if self.workers.pop(worker_id, None) is not None:
+                self.order.remove(worker_id)
+
+    def _pick(self, nbytes, exclude=()):
+        """Choose a worker outside exclude under the current policy (caller holds self.lock)"""
+        order = [worker_id for worker_id in self.order if worker_id not in exclude] or self.order
+        if self.policy == "round_robin":
+            worker_id = order[self.next_index % len(order)]
+            self.next_index += 1
+            return self.workers[worker_id]
+
+        if self.policy == "p2c" and len(order) > 2:
+            candidates = [self.workers[worker_id] for worker_id in random.sample(order, 2)]
+        else:
+            candidates = [self.workers[worker_id] for worker_id in order]
+        return min(candidates, key=lambda worker: worker.load(nbytes))
+
+    def _assign(self, worker, task_id, nbytes):
+        """Count a task against worker (caller holds self.lock)"""
+        worker.in_flight += 1
+        worker.bytes_in_flight += nbytes
+        worker.dispatched += 1
+        worker.bytes_sent += nbytes
+        if task_id is not None:
+            self.assignments.setdefault(task_id, []).append((worker.worker_id, nbytes))
+
+    def acquire(self, task_id=None, nbytes=0, exclude=()):
+        """Pick a worker for a task and count the task against it, returning (worker_id, url) or None
+
+        Workers in exclude are only used if there is no other choice.
+        """
+        with self.lock:
+            if not self.workers:
+                return None
+            worker = self._pick(nbytes, exclude)
+            self._assign(worker, task_id, nbytes)
+            return worker.worker_id, worker.url
+
+    def assign(self, task_id, worker_id, nbytes=0):
+        """Count a task a worker chose itself (pull mode) against that worker"""
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is not None:
+                self._assign(worker, task_id, nbytes)
+
+    def release(self, task_id, completed=True, worker_id=None):
+        """Stop counting every copy of a task, or only the copy on worker_id (unknown tasks are ignored)"""
+        with self.lock:
+            copies = self.assignments.pop(task_id, [])
+            if worker_id is not None:
+                released = [copy for copy in copies if copy[0] == worker_id][:1]
+                kept = list(copies)
+                for copy in released:
+                    kept.remove(copy)
+                if kept:
+                    self.assignments[task_id] = kept
+                copies = released
+
+            for copy_worker_id, nbytes in copies:
+                worker = self.workers.get(copy_worker_id)
+                if worker is None:
+                    continue
+                worker.in_flight -= 1
+                worker.bytes_in_flight -= nbytes
+                if completed:
+                    worker.completed += 1
+
+    def stats(self):
+        """Snapshot of the policy and per-worker counters"""
+        with self.lock:
+            return {
+                'policy': self.policy,
+                'unreleased': len(self.assignments),
+                'workers': {worker_id: worker.stats() for worker_id, worker in self.workers.items()}
+            }
+
+class ReadyQueue:
+    """Tasks waiting to be taken, served lowest priority number first and FIFO within a priority
+
+    A task put with a delay waits in a heap and joins its priority's queue
+    once the delay has passed.
+    """
+    def __init__(self, levels=2):
+        self.queues = [deque() for _ in range(levels)]
+        self.delayed = []  # Heap of (due time, sequence, priority, task)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def put(self, task, priority, delay=0):
+        with self.condition:
+            if delay > 0:
+                heapq.heappush(self.delayed, (time.time() + delay, next(self.sequence), priority, task))
+            else:
+                self.queues[min(max(priority, 0), len(self.queues) - 1)].append(task)
+            self.condition.notify()
+
+    def _promote(self):
+        """Move delayed tasks that are due into their queues (caller holds self.condition)"""
+        now = time.time()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, priority, task = heapq.heappop(self.delayed)
+            self.queues[min(max(priority, 0), len(self.queues) - 1)].append(task)
+
+    def get(self, timeout):
+        """Take the next task, waiting up to timeout seconds for one (None if none arrived)"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                self._promote()
+                for queue in self.queues:
+                    if queue:
+                        return queue.popleft()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                if self.delayed:
+                    remaining = min(remaining, self.delayed[0][0] - time.time())
+                self.condition.wait(max(remaining, 0))
+
+    def depths(self):
+        """Tasks waiting in each priority's queue, then the number still delayed"""
+        with self.condition:
+            self._promote()
+            return [len(queue) for queue in self.queues] + [len(self.delayed)]
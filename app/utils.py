@@ -1,3 +1,5 @@
+import json
+import threading
 import numpy as np
 import hashlib
 from enum import Enum
@@ -5,20 +7,55 @@ import requests
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    # Sparse products fall back to the NumPy kernel in csr_multiply
+    sparse = None
+
+from wire import WIRE_FORMAT, CONTENT_TYPE, encode_frames, decode_frames, is_binary, release_shared, requested_codecs
+
+# Keys of the corrections returned by peel_corrections, in the order they are sent
+PEEL_KEYS = ["u", "v", "row", "col"]
+
+# JSON keys of a /return_batch body: both operands of each product, then the peel corrections
+BATCH_KEYS = [f"matrix_{side}_{i}" for i in range(7) for side in ("a", "b")] + PEEL_KEYS
+
 class TaskType(Enum):
     MULTIPLY = "multiply"
     COMBINE = "combine"
+    TILE = "tile"  # One tile of C, accumulated over K-block pairs [A_i0, B_0j, A_i1, B_1j, ...]
+
+def content_hash(*matrices):
+    """Short hex digest of the dtypes, shapes and raw bytes of matrices
+
+    SHA-1 is used for speed (it is hardware accelerated on most CPUs); 64 bits
+    keep accidental collisions between task IDs out of reach.
+    """
+    digest = hashlib.sha1()
+    for matrix in matrices:
+        digest.update(f"{matrix.dtype.str}{matrix.shape}".encode())
+        digest.update(np.ascontiguousarray(matrix))
+    return digest.hexdigest()[:16]
+
+def zip_dtypes(values, dtypes):
+    """Pair nested-list matrices with their dtypes (None where a dtype was not sent)"""
+    dtypes = list(dtypes or [])
+    return zip(values, dtypes + [None] * (len(values) - len(dtypes)))
 
 class Task:
-    def __init__(self, task_type, matrices=None, subtasks_results=None, parent_id=None, m_number=None):
+    def __init__(self, task_type, matrices=None, subtasks_results=None, parent_id=None, m_number=None, job_id=None, peel=None, route=None, task_id=None):
         self.task_type = task_type
         self.matrices = matrices  # For MULTIPLY : [A, B]
         self.subtasks_results = subtasks_results  # For COMBINE: [M1, M2, ..., M7]
+        self.peel = peel  # For COMBINE: odd row/column corrections from peel_corrections
         self.m_number = m_number # Also for COMBINE
         self.parent_id = parent_id  # ID of the parent task
+        self.job_id = job_id  # ID of the client task this belongs to
+        self.route = route  # {url, slot, m_number} of a worker collecting this result directly, if any
 
-        # Generate task ID based on content
-        self.task_id = self._generate_id()
+        # Generate task ID based on content (decoded tasks keep the ID they were sent with)
+        self.task_id = task_id or self._generate_id()
         
     def _generate_id(self):
         """Generate a readable ID based on task content"""
@@ -26,8 +63,12 @@ class Task:
             # Use matrix dimensions and hash of content
             matrix_a, matrix_b = self.matrices
             dim_str = f"{matrix_a.shape[0]}x{matrix_a.shape[1]}_{matrix_b.shape[0]}x{matrix_b.shape[1]}"
-            content_hash = hashlib.md5(np.array_str(matrix_a).encode() + np.array_str(matrix_b).encode()).hexdigest()[:6]
-            return f"{self.task_type.value}_{dim_str}_{content_hash}"
+            return f"{self.task_type.value}_{dim_str}_{content_hash(matrix_a, matrix_b)}"
+
+        elif self.task_type == TaskType.TILE:
+            # Tile dimensions and K-block count, with a hash of every block
+            (rows, _), cols = self.matrices[0].shape, self.matrices[1].shape[1]
+            return f"{self.task_type.value}_{rows}x{cols}_k{len(self.matrices) // 2}_{content_hash(*self.matrices)}"
         
         elif self.task_type == TaskType.COMBINE:
             # Use parent_id if available, otherwise timestamp
@@ -37,13 +78,20 @@ class Task:
         # Fallback
         return f"{self.task_type.value}_{int(self.created_at)}"
     
+    def nbytes(self):
+        """Bytes of matrix data carried by the task"""
+        matrices = list(self.matrices or []) + list(self.subtasks_results or []) + list((self.peel or {}).values())
+        return sum(matrix.nbytes for matrix in matrices)
+
     def to_dict(self):
         """Convert task to dictionary for JSON serialization"""
         result = {
             "task_id": self.task_id,
             "task_type": self.task_type.value,
             "parent_id": self.parent_id,
-            "m_number": self.m_number
+            "m_number": self.m_number,
+            "job_id": self.job_id,
+            "route": self.route
         }
         
         if self.matrices is not None:
@@ -51,33 +99,95 @@ class Task:
             
         if self.subtasks_results is not None:
             result["subtasks_results"] = [matrix.tolist() for matrix in self.subtasks_results]
+
+        if self.peel:
+            result["peel"] = {key: matrix.tolist() for key, matrix in self.peel.items()}
+
+        # Nested lists lose the dtype, so it travels alongside
+        result["dtypes"] = {
+            "matrices": [matrix.dtype.str for matrix in self.matrices or []],
+            "subtasks_results": [matrix.dtype.str for matrix in self.subtasks_results or []],
+            "peel": {key: matrix.dtype.str for key, matrix in (self.peel or {}).items()}
+        }
             
         return result
         
     @classmethod
     def from_dict(cls, data):
         """Create a Task instance from a dictionary"""
+        # Older senders do not send dtypes, leaving numpy to infer them
+        dtypes = data.get("dtypes", {})
         if "matrices" in data:
-            matrices = [np.array(matrix) for matrix in data["matrices"]]
+            matrices = [np.array(matrix, dtype=dtype) for matrix, dtype in zip_dtypes(data["matrices"], dtypes.get("matrices"))]
         else:
             matrices = None
 
         if "subtasks_results" in data:
-            subtasks_results = [np.array(matrix) for matrix in data["subtasks_results"]]
+            subtasks_results = [np.array(matrix, dtype=dtype) for matrix, dtype in zip_dtypes(data["subtasks_results"], dtypes.get("subtasks_results"))]
         else:
             subtasks_results = None
 
+        peel_dtypes = dtypes.get("peel", {})
+        peel = {key: np.array(matrix, dtype=peel_dtypes.get(key)) for key, matrix in data.get("peel", {}).items()}
+
         task = cls(
             task_type=TaskType(data["task_type"]),
             parent_id=data.get("parent_id"),
             matrices=matrices,
             subtasks_results=subtasks_results,
-            m_number=data.get("m_number")
+            m_number=data.get("m_number"),
+            job_id=data.get("job_id"),
+            peel=peel or None,
+            route=data.get("route"),
+            task_id=data["task_id"]
         )
-        task.task_id = data["task_id"]
         
         return task
 
+    def to_bytes(self, shared_files=None, codecs=None, stats=None):
+        """Convert task to a binary frame body (see encode_frames for shared_files, codecs and stats)"""
+        meta = {
+            "task_id": self.task_id,
+            "task_type": self.task_type.value,
+            "parent_id": self.parent_id,
+            "m_number": self.m_number,
+            "job_id": self.job_id,
+            "route": self.route,
+            "num_matrices": len(self.matrices) if self.matrices is not None else None,
+            "num_results": len(self.subtasks_results) if self.subtasks_results is not None else None,
+            "peel_keys": list(self.peel or {})
+        }
+        frames = list(self.matrices or []) + list(self.subtasks_results or []) + list((self.peel or {}).values())
+        return encode_frames(meta, frames, shared_files, codecs, stats)
+
+    @classmethod
+    def from_bytes(cls, body):
+        """Create a Task instance from a binary frame body"""
+        meta, frames = decode_frames(body)
+        num_matrices = meta.get("num_matrices")
+        num_results = meta.get("num_results")
+
+        results_start = num_matrices or 0
+        peel_start = results_start + (num_results or 0)
+
+        matrices = frames[:num_matrices] if num_matrices is not None else None
+        subtasks_results = frames[results_start:peel_start] if num_results is not None else None
+        peel = dict(zip(meta.get("peel_keys", []), frames[peel_start:]))
+
+        task = cls(
+            task_type=TaskType(meta["task_type"]),
+            parent_id=meta.get("parent_id"),
+            matrices=matrices,
+            subtasks_results=subtasks_results,
+            m_number=meta.get("m_number"),
+            job_id=meta.get("job_id"),
+            peel=peel or None,
+            route=meta.get("route"),
+            task_id=meta["task_id"]
+        )
+
+        return task
+
 
 def pad_matrices(A, B):
     """Pad matrices to the next power of 2 if needed for Strassen's algorithm"""
@@ -89,42 +199,457 @@ def pad_matrices(A, B):
         m *= 2
         
     # Pad matrices
-    A_padded = np.zeros((m, m), dtype=np.int32)
-    B_padded = np.zeros((m, m), dtype=np.int32)
+    dtype = np.result_type(A, B)
+    A_padded = np.zeros((m, m), dtype=dtype)
+    B_padded = np.zeros((m, m), dtype=dtype)
     
     A_padded[:A.shape[0], :A.shape[1]] = A
     B_padded[:B.shape[0], :B.shape[1]] = B
     
     return A_padded, B_padded, A.shape, B.shape
 
+def float64_exact(matrix_a, matrix_b, winograd_levels=0):
+    """Check that every intermediate of an integer Strassen product is exactly representable in float64
+
+    Each Strassen level at most doubles the entries of both operands of a
+    product (a factor of 4), each Strassen-Winograd level at most triples them
+    (a factor of 9, from S2 * T2), and a combine sums at most four products.
+    With winograd_levels of the levels run by local_strassen, no value exceeds
+    4 * k * 4**strassen_levels * 9**winograd_levels * max|A| * max|B|, which
+    must stay below 2**53.
+    """
+    k = matrix_a.shape[1]
+    levels = max(max(matrix_a.shape + matrix_b.shape) - 1, 1).bit_length()
+    winograd_levels = min(winograd_levels, levels)
+    max_a = max(abs(int(matrix_a.max())), abs(int(matrix_a.min())))
+    max_b = max(abs(int(matrix_b.max())), abs(int(matrix_b.min())))
+    return 4 * k * 4 ** (levels - winograd_levels) * 9 ** winograd_levels * max_a * max_b < 2 ** 53
+
+def compute_dtypes(matrix_a, matrix_b, accumulate="auto", winograd_levels=0):
+    """Return (compute_dtype, result_dtype) for matrix_a @ matrix_b
+
+    Floating-point inputs are multiplied in their own precision. Integers
+    accumulate in int64 so large products cannot overflow, or with
+    accumulate="auto" in BLAS-backed float64 when float64_exact proves the
+    result exact. Raises ValueError for non-numeric dtypes.
+    """
+    dtype = np.result_type(matrix_a, matrix_b)
+    if dtype.kind in "fc":
+        return dtype, dtype
+    if dtype.kind not in "biu":
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    result_dtype = np.dtype(np.uint64 if dtype == np.uint64 else np.int64)
+    if accumulate == "auto" and float64_exact(matrix_a, matrix_b, winograd_levels):
+        return np.dtype(np.float64), result_dtype
+    return result_dtype, result_dtype
+
+def cast_result(result, dtype):
+    """Convert a result to the job's result dtype (float64 results of integer jobs are exact, so rounding only drops the float representation)"""
+    if result.dtype == dtype:
+        return result
+    if result.dtype.kind == "f" and dtype.kind in "iu":
+        result = np.rint(result)
+    return result.astype(dtype)
+
+def is_zero_matrix(matrix):
+    """Check whether a matrix has no non-zero entries"""
+    return not matrix.any()
+
+def product_shape(matrix_a, matrix_b):
+    """Shape and dtype of matrix_a @ matrix_b"""
+    return (matrix_a.shape[0], matrix_b.shape[1]), np.result_type(matrix_a, matrix_b)
+
 def unpad_matrix(C_padded, original_A_shape, original_B_shape):
     """Extract original sized result from padded result matrix"""
     return C_padded[:original_A_shape[0], :original_B_shape[1]]
 
 def split_matrix(matrix):
-    """Split matrix into 4 quadrants"""
-    n = matrix.shape[0] // 2
+    """Split matrix (or a stack of matrices) into 4 quadrant views (an odd last row or column is left out for peeling)"""
+    rows = matrix.shape[-2] // 2
+    cols = matrix.shape[-1] // 2
     
-    a11 = matrix[:n, :n]
-    a12 = matrix[:n, n:]
-    a21 = matrix[n:, :n]
-    a22 = matrix[n:, n:]
+    a11 = matrix[..., :rows, :cols]
+    a12 = matrix[..., :rows, cols:2*cols]
+    a21 = matrix[..., rows:2*rows, :cols]
+    a22 = matrix[..., rows:2*rows, cols:2*cols]
     
     return a11, a12, a21, a22
 
-def join_matrices(c11, c12, c21, c22):
-    """Join 4 quadrants into a single matrix"""
-    n = c11.shape[0]
-    result = np.zeros((2*n, 2*n), dtype=np.int32)
-    
-    result[:n, :n] = c11
-    result[:n, n:] = c12
-    result[n:, :n] = c21
-    result[n:, n:] = c22
-    
+class WorkspacePool:
+    """Idle scratch arrays kept by shape and dtype, so repeated kernels reuse them instead of allocating
+
+    Only arrays taken from the pool (or otherwise owned by nobody else) may be
+    given back; views are ignored.
+    """
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.free = {}  # Map (shape, dtype) to idle arrays
+        self.nbytes = 0  # Bytes held by idle arrays
+        self.lock = threading.Lock()
+
+    def take(self, shape, dtype):
+        """An uninitialized array of shape and dtype"""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self.lock:
+            idle = self.free.get(key)
+            if idle:
+                array = idle.pop()
+                self.nbytes -= array.nbytes
+                return array
+        return np.empty(shape, dtype=dtype)
+
+    def give(self, *arrays):
+        """Return arrays for reuse, dropping any the pool has no room for"""
+        with self.lock:
+            for array in arrays:
+                if array.base is not None or not array.flags.c_contiguous or self.nbytes + array.nbytes > self.max_bytes:
+                    continue
+                self.free.setdefault((array.shape, array.dtype.str), []).append(array)
+                self.nbytes += array.nbytes
+
+def scratch(pool, shape, dtype):
+    """Take an array from pool, or allocate one without a pool"""
+    return pool.take(shape, dtype) if pool is not None else np.empty(shape, dtype=dtype)
+
+def peel_corrections(matrix_a, matrix_b):
+    """Compute the fix-ups for the odd row/column that split_matrix leaves out
+
+    With A (m x k) and B (k x n), Strassen only covers the even core
+    A[:m2, :k2] @ B[:k2, :n2]. The rest of C is recovered with:
+      * u, v  : rank-1 update u @ v added to the core when k is odd
+      * row   : C[m2:, :] = A[m2:, :] @ B when m is odd (GEMV)
+      * col   : C[:m2, n2:] = A[:m2, :] @ B[:, n2:] when n is odd (GEMV)
+    Returns an empty dict when every dimension is even.
+    """
+    m, k = matrix_a.shape
+    n = matrix_b.shape[1]
+    m2, k2, n2 = m - m % 2, k - k % 2, n - n % 2
+
+    peel = {}
+    if k != k2:
+        # Copies, so the small vectors don't keep the whole operands alive
+        peel["u"] = matrix_a[:m2, k2:].copy()
+        peel["v"] = matrix_b[k2:, :n2].copy()
+    if m != m2:
+        peel["row"] = matrix_a[m2:, :] @ matrix_b
+    if n != n2:
+        peel["col"] = matrix_a[:m2, :] @ matrix_b[:, n2:]
+    return peel
+
+def add_peel(out, peel):
+    """Fill in the peel corrections around the Strassen result already in the even core of out"""
+    m2 = out.shape[0] - (peel["row"].shape[0] if "row" in peel else 0)
+    n2 = out.shape[1] - (peel["col"].shape[1] if "col" in peel else 0)
+    if "u" in peel:
+        out[:m2, :n2] += peel["u"] @ peel["v"]
+    if "row" in peel:
+        out[m2:, :] = peel["row"]
+    if "col" in peel:
+        out[:m2, n2:] = peel["col"]
+    return out
+
+def strassen_products(matrix_a, matrix_b, pool=None):
+    """Build the operand pairs of the 7 products required by Strassen's algorithm
+
+    Only the even core is covered; see peel_corrections for odd dimensions.
+    The 10 operand sums are taken from pool if given, and may be given back
+    once the products have been sent.
+    """
+    a11, a12, a21, a22 = split_matrix(matrix_a)
+    b11, b12, b21, b22 = split_matrix(matrix_b)
+
+    def add(x, y):
+        return np.add(x, y, out=scratch(pool, x.shape, np.result_type(x, y)))
+
+    def subtract(x, y):
+        return np.subtract(x, y, out=scratch(pool, x.shape, np.result_type(x, y)))
+
+    return [
+        # M1 = (A11 + A22) * (B11 + B22)
+        [add(a11, a22), add(b11, b22)],
+
+        # M2 = (A21 + A22) * B11
+        [add(a21, a22), b11],
+
+        # M3 = A11 * (B12 - B22)
+        [a11, subtract(b12, b22)],
+
+        # M4 = A22 * (B21 - B11)
+        [a22, subtract(b21, b11)],
+
+        # M5 = (A11 + A12) * B22
+        [add(a11, a12), b22],
+
+        # M6 = (A21 - A11) * (B11 + B12)
+        [subtract(a21, a11), add(b11, b12)],
+
+        # M7 = (A12 - A22) * (B21 + B22)
+        [subtract(a12, a22), add(b21, b22)]
+    ]
+
+def strassen_combine(results, peel=None, pool=None):
+    """Combine the 7 Strassen products (and any peel corrections) into the full result matrix
+
+    The quadrants are accumulated in place in one output array (taken from
+    pool if given), so no temporaries or join copy are made. Stacks of
+    products (without peel) combine into a stack of results.
+    """
+    m1, m2, m3, m4, m5, m6, m7 = results
+    rows, cols = m1.shape[-2:]
+    rows = 2 * rows + (peel["row"].shape[0] if peel and "row" in peel else 0)
+    cols = 2 * cols + (peel["col"].shape[1] if peel and "col" in peel else 0)
+    out = scratch(pool, m1.shape[:-2] + (rows, cols), np.result_type(*results))
+    c11, c12, c21, c22 = split_matrix(out)
+
+    # C11 = M1 + M4 - M5 + M7
+    np.add(m1, m4, out=c11)
+    np.subtract(c11, m5, out=c11)
+    np.add(c11, m7, out=c11)
+
+    # C12 = M3 + M5
+    np.add(m3, m5, out=c12)
+
+    # C21 = M2 + M4
+    np.add(m2, m4, out=c21)
+
+    # C22 = M1 - M2 + M3 + M6
+    np.subtract(m1, m2, out=c22)
+    np.add(c22, m3, out=c22)
+    np.add(c22, m6, out=c22)
+
+    return add_peel(out, peel) if peel else out
+
+def local_strassen(matrix_a, matrix_b, cutoff, pool=None, out=None):
+    """Multiply in-process with Strassen-Winograd, switching to a single GEMM once a dimension is at most cutoff
+
+    Each level does 15 additions instead of Strassen's 18, in place on three
+    scratch quadrants from pool, and every product is written straight into
+    its quadrant of out (allocated if None).
+    """
+    m, k = matrix_a.shape
+    n = matrix_b.shape[1]
+    if out is None:
+        out = np.empty((m, n), dtype=np.result_type(matrix_a, matrix_b))
+    if min(m, k, n) <= max(cutoff, 1):
+        return np.matmul(matrix_a, matrix_b, out=out)
+
+    a11, a12, a21, a22 = split_matrix(matrix_a)
+    b11, b12, b21, b22 = split_matrix(matrix_b)
+    c11, c12, c21, c22 = split_matrix(out)
+    s = scratch(pool, a11.shape, out.dtype)
+    t = scratch(pool, b11.shape, out.dtype)
+    p1 = scratch(pool, c11.shape, out.dtype)
+
+    def multiply(x, y, into):
+        local_strassen(x, y, cutoff, pool, into)
+
+    # The schedule keeps P1 in its own buffer and every other product in a quadrant of C until it is folded in
+    np.subtract(a11, a21, out=s)     # S3 = A11 - A21
+    np.subtract(b22, b12, out=t)     # T3 = B22 - B12
+    multiply(s, t, c21)              # P7 = S3 T3
+    np.add(a21, a22, out=s)          # S1 = A21 + A22
+    np.subtract(b12, b11, out=t)     # T1 = B12 - B11
+    multiply(s, t, c22)              # P5 = S1 T1
+    np.subtract(s, a11, out=s)       # S2 = S1 - A11
+    np.subtract(b22, t, out=t)       # T2 = B22 - T1
+    multiply(s, t, c12)              # P6 = S2 T2
+    np.subtract(a12, s, out=s)       # S4 = A12 - S2
+    multiply(s, b22, c11)            # P3 = S4 B22
+    multiply(a11, b11, p1)           # P1 = A11 B11
+    np.add(p1, c12, out=c12)         # U2 = P1 + P6
+    np.add(c12, c21, out=c21)        # U3 = U2 + P7
+    np.add(c12, c22, out=c12)        # U4 = U2 + P5
+    np.add(c21, c22, out=c22)        # C22 = U3 + P5
+    np.add(c12, c11, out=c12)        # C12 = U4 + P3
+    np.subtract(t, b21, out=t)       # T4 = T2 - B21
+    multiply(a22, t, c11)            # P4 = A22 T4
+    np.subtract(c21, c11, out=c21)   # C21 = U3 - P4
+    multiply(a12, b21, c11)          # P2 = A12 B21
+    np.add(p1, c11, out=c11)         # C11 = P1 + P2
+
+    if pool is not None:
+        pool.give(s, t, p1)
+
+    # Odd dimensions: rank-1 update of the core, then the last row and column straight into out
+    m2, k2, n2 = m - m % 2, k - k % 2, n - n % 2
+    if k != k2:
+        out[:m2, :n2] += matrix_a[:m2, k2:] @ matrix_b[k2:, :n2]
+    if m != m2:
+        np.matmul(matrix_a[m2:, :], matrix_b, out=out[m2:, :])
+    if n != n2:
+        np.matmul(matrix_a[:m2, :], matrix_b[:, n2:], out=out[:m2, n2:])
+    return out
+
+def batch_levels(matrix_a, matrix_b, cutoff):
+    """Strassen levels needed before the smallest dimension of matrix_a @ matrix_b is at most cutoff"""
+    size = min(matrix_a.shape[0], matrix_a.shape[1], matrix_b.shape[1])
+    levels = 0
+    while size > max(cutoff, 1):
+        size = -(-size // 2)
+        levels += 1
+    return levels
+
+def batched_strassen(matrix_a, matrix_b, levels):
+    """Multiply with levels of Strassen expanded breadth-first, computing all 7^levels leaf products in one stacked matmul
+
+    The operands are zero-padded to a multiple of 2^levels, so every level
+    splits evenly. Each level turns a stack of p operand pairs into 7p
+    pairs, and the combines fold the stack of leaf products back up 7 at a
+    time, so a whole subtree costs a few large NumPy calls however small
+    its leaves are.
+    """
+    m, k = matrix_a.shape
+    n = matrix_b.shape[1]
+    step = 1 << levels
+    dtype = np.result_type(matrix_a, matrix_b)
+    stack_a = np.zeros((1, -(-m // step) * step, -(-k // step) * step), dtype=dtype)
+    stack_b = np.zeros((1, stack_a.shape[2], -(-n // step) * step), dtype=dtype)
+    stack_a[0, :m, :k] = matrix_a
+    stack_b[0, :k, :n] = matrix_b
+
+    for _ in range(levels):
+        products = strassen_products(stack_a, stack_b)
+        stack_a = np.concatenate([a for a, _ in products])
+        stack_b = np.concatenate([b for _, b in products])
+
+    results = np.matmul(stack_a, stack_b)
+    for _ in range(levels):
+        results = strassen_combine(np.split(results, 7))
+    return results[0, :m, :n]
+
+def density(matrix):
+    """Fraction of a matrix's entries that are non-zero"""
+    return np.count_nonzero(matrix) / matrix.size if matrix.size else 0.0
+
+def is_sparse_product(matrix_a, matrix_b, cutoff):
+    """Check whether either operand is sparse enough (density at most cutoff) for sparse_multiply"""
+    return cutoff > 0 and min(density(matrix_a), density(matrix_b)) <= cutoff
+
+def csr_multiply(sparse_a, dense_b):
+    """NumPy-only sparse_a @ dense_b, walking the non-empty rows of sparse_a as CSR: row i of the result is a[i, nz] @ b[nz, :]"""
+    result = np.zeros((sparse_a.shape[0], dense_b.shape[1]), dtype=np.result_type(sparse_a, dense_b))
+    rows, inner = np.nonzero(sparse_a)
+    if not rows.size:
+        return result
+    values = sparse_a[rows, inner]
+    # np.nonzero returns the entries row by row, so each row's entries are one run
+    bounds = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1], True])
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        result[rows[start]] = values[start:end] @ dense_b[inner[start:end]]
+    return result
+
+def sparse_multiply(matrix_a, matrix_b, cutoff):
+    """Multiply matrices of which at least one is mostly zeros, returning a dense result
+
+    Rows and columns that cannot contribute (all zero) are dropped first, so
+    zero padding costs nothing. If what is left is still sparse (density at
+    most cutoff), the sparser operand is multiplied as a CSR matrix with
+    SciPy, or with csr_multiply without it; otherwise the compacted
+    blocks go to BLAS.
+    """
+    shape, dtype = product_shape(matrix_a, matrix_b)
+    inner = np.flatnonzero(matrix_a.any(axis=0) & matrix_b.any(axis=1))
+    if not inner.size:
+        return np.zeros(shape, dtype=dtype)
+    rows = np.flatnonzero(matrix_a[:, inner].any(axis=1))
+    cols = np.flatnonzero(matrix_b[inner].any(axis=0))
+    # Only copy the operands if something was actually dropped
+    block_a = matrix_a if (rows.size, inner.size) == matrix_a.shape else matrix_a[np.ix_(rows, inner)]
+    block_b = matrix_b if (inner.size, cols.size) == matrix_b.shape else matrix_b[np.ix_(inner, cols)]
+
+    density_a, density_b = density(block_a), density(block_b)
+    if min(density_a, density_b) > cutoff:
+        block = block_a @ block_b
+    elif density_a <= density_b:
+        block = sparse.csr_matrix(block_a) @ block_b if sparse is not None else csr_multiply(block_a, block_b)
+    else:
+        # (A B)^T = B^T A^T puts the sparser operand first
+        if sparse is not None:
+            block = (sparse.csr_matrix(block_b.T) @ block_a.T).T
+        else:
+            block = csr_multiply(np.ascontiguousarray(block_b.T), np.ascontiguousarray(block_a.T)).T
+
+    if (rows.size, cols.size) == shape:
+        return np.asarray(block, dtype=dtype)
+    result = np.zeros(shape, dtype=dtype)
+    result[np.ix_(rows, cols)] = block
     return result
 
-def create_retry_session(retries=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504, 104)):
+def block_products(matrix_a, matrix_b, kind, count):
+    """Build the operand pairs of a row, column or inner-dimension block decomposition"""
+    if kind == "rows":
+        return [[block, matrix_b] for block in np.array_split(matrix_a, count, axis=0)]
+    if kind == "cols":
+        return [[matrix_a, block] for block in np.array_split(matrix_b, count, axis=1)]
+    if kind == "inner":
+        return [list(pair) for pair in zip(np.array_split(matrix_a, count, axis=1), np.array_split(matrix_b, count, axis=0))]
+    raise ValueError(f"Unknown block decomposition: {kind}")
+
+def tile_grid(m, n, count):
+    """Pick a rows x cols grid of about count tiles for an m x n result, keeping the tiles close to square"""
+    rows = min(m, max(1, round((count * m / n) ** 0.5)))
+    cols = min(n, max(1, -(-count // rows)))
+    return rows, cols
+
+def tile_products(matrix_a, matrix_b, rows, cols, k_blocks):
+    """Build the operands of every tile of a rows x cols grid, in row-major order
+
+    Tile (i, j) of the result is the sum over k of A_ik @ B_kj, so its
+    operands are the K-block pairs [A_i0, B_0j, A_i1, B_1j, ...].
+    """
+    a_blocks = [np.array_split(panel, k_blocks, axis=1) for panel in np.array_split(matrix_a, rows, axis=0)]
+    b_blocks = [np.array_split(panel, k_blocks, axis=0) for panel in np.array_split(matrix_b, cols, axis=1)]
+    return [
+        [block for pair in zip(a_row, b_col) for block in pair]
+        for a_row in a_blocks
+        for b_col in b_blocks
+    ]
+
+def assemble_blocks(kind, results, columns=None):
+    """Join the block products of block_products (or the tiles of tile_products, columns per row) back into the full result"""
+    if kind == "tiles":
+        return np.block([results[start:start + columns] for start in range(0, len(results), columns)])
+    if kind == "rows":
+        return np.vstack(results)
+    if kind == "cols":
+        return np.hstack(results)
+    if kind == "inner":
+        total = np.array(results[0], dtype=np.result_type(*results))
+        for partial in results[1:]:
+            total += partial
+        return total
+    raise ValueError(f"Unknown block decomposition: {kind}")
+
+def send_task(session, url, task, shared=False, stats=None, **kwargs):
+    """POST a task using the configured wire format (large matrices go through SHM_DIR if shared, codec stats go to stats)"""
+    if WIRE_FORMAT == "json":
+        return session.post(url, json=task.to_dict(), **kwargs)
+    shared_files = [] if shared else None
+    try:
+        return session.post(url, data=task.to_bytes(shared_files, stats=stats), headers={"Content-Type": CONTENT_TYPE}, **kwargs)
+    finally:
+        release_shared(shared_files or [])
+
+def read_task(req):
+    """Build a Task from a Flask request in either wire format"""
+    if is_binary(req):
+        return Task.from_bytes(req.get_data())
+    return Task.from_dict(req.json)
+
+def encode_task_response(req, task, stats=None):
+    """Build (body, content_type) for a task in the format and codecs the requester accepts"""
+    if req.accept_mimetypes.best_match([CONTENT_TYPE, "application/json"]) == CONTENT_TYPE:
+        return task.to_bytes(codecs=requested_codecs(req), stats=stats), CONTENT_TYPE
+    return json.dumps(task.to_dict()), "application/json"
+
+def read_task_response(response):
+    """Build a Task from a requests response in either wire format"""
+    if response.headers.get("Content-Type", "").split(";")[0] == CONTENT_TYPE:
+        return Task.from_bytes(response.content)
+    return Task.from_dict(response.json())
+
+def create_retry_session(retries=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504, 104), pool_maxsize=10):
     """Creates a session that automatically retries communication on a failure"""
     session = requests.Session()
     retry = Retry(
@@ -134,6 +659,6 @@ def create_retry_session(retries=3, backoff_factor=0.5, status_forcelist=(500, 5
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     return session
\ No newline at end of file
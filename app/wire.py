@@ -0,0 +1,480 @@
+import os
+import mmap
+import json
+import time
+import uuid
+import zlib
+import struct
+import tempfile
+import numpy as np
+
+# Binary body layout:
+#   MAGIC | uint32 header length | JSON header | padding | frame buffers
+# The JSON header carries the request metadata plus a descriptor (dtype, shape,
+# offset, nbytes) for every matrix frame. Each frame buffer starts on an
+# ALIGNMENT boundary so it can be viewed in place with np.frombuffer.
+MAGIC = b"SMX1"
+ALIGNMENT = 64
+CONTENT_TYPE = "application/x-strassen-frames"
+
+# Format used for outgoing matrices ("binary" or "json"). Incoming requests are
+# always accepted in both formats.
+WIRE_FORMAT = os.environ.get('WIRE_FORMAT', 'binary').lower()
+
+# Peers on the same host can skip copying large matrices through HTTP: each
+# one is written to a file in SHM_DIR (a tmpfs by default) and only its name
+# travels in the frame header. The receiver maps the file in place, and the
+# sender unlinks it once the request is answered, so its memory is freed as
+# soon as the receiver drops the last array viewing it.
+SHM_TRANSPORT = os.environ.get('SHM_TRANSPORT', '1') == '1'
+SHM_DIR = os.environ.get('SHM_DIR', '/dev/shm/strassen' if os.path.isdir('/dev/shm') else os.path.join(tempfile.gettempdir(), 'strassen'))
+# Smaller matrices are cheaper to send inline than to create a file for
+SHM_MIN_BYTES = max(1, int(os.environ.get('SHM_MIN_BYTES', 1 << 16)))
+
+# Encodings applied to inline frames, in this order, wherever they pay off:
+#   narrow : integer-valued matrices are stored in the smallest integer dtype holding their range
+#   csr    : matrices with at most SPARSE_DENSITY nonzeros send only those (compressed sparse rows)
+#   zlib   : frames of at least COMPRESS_MIN_BYTES are deflated if that shrinks them to COMPRESS_RATIO
+# zlib is off by default: on matrix data it costs far more time than the bytes
+# it saves are worth on a fast link. Requests use the sender's WIRE_CODECS, since
+# every node decodes them all; responses only use the ones the requester lists
+# in the CODECS_HEADER header.
+ENCODINGS = ("narrow", "csr", "zlib")
+WIRE_CODECS = [name for name in os.environ.get('WIRE_CODECS', 'narrow,csr').lower().split(",") if name in ENCODINGS]
+SPARSE_DENSITY = float(os.environ.get('SPARSE_DENSITY', 0.1))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 4096))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 1))
+COMPRESS_RATIO = float(os.environ.get('COMPRESS_RATIO', 0.5))
+# Bytes deflated from each of a few places in a large frame to decide whether the whole frame is worth it
+COMPRESS_SAMPLE_BYTES = int(os.environ.get('COMPRESS_SAMPLE_BYTES', 16384))
+CODECS_HEADER = "X-Frame-Codecs"
+
+_PREFIX = struct.Struct("<4sI")
+_host_id = None
+
+def _pid_namespace():
+    """Identifier of this process's PID namespace (Linux only), or None where PIDs cannot be compared"""
+    try:
+        return os.readlink("/proc/self/ns/pid").strip("pid:[]")
+    except (OSError, AttributeError):
+        return None
+
+# Files in SHM_DIR are named after the PID namespace and PID of their sender, so a
+# node starting up can tell which ones were left behind by a sender that was killed
+_PID_NAMESPACE = _pid_namespace()
+
+def _align(offset):
+    """Round offset up to the next frame boundary"""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _raw_bytes(array):
+    """The buffer of a C-contiguous array as flat bytes (a memoryview cannot cast an empty array, which has none)"""
+    return memoryview(array).cast("B") if array.size else b""
+
+def shm_host_id():
+    """Token shared by every node that sees the same SHM_DIR, or None if the shared-memory transport is off"""
+    global _host_id
+    if _host_id is None:
+        _host_id = ""
+        if SHM_TRANSPORT:
+            try:
+                os.makedirs(SHM_DIR, exist_ok=True)
+                path = os.path.join(SHM_DIR, "host_id")
+                if not os.path.exists(path):
+                    # Linking a complete file into place keeps concurrent starters from reading a partial token
+                    temp = os.path.join(SHM_DIR, f"host_id.{os.getpid()}")
+                    with open(temp, "w") as f:
+                        f.write(uuid.uuid4().hex)
+                    try:
+                        os.link(temp, path)
+                    except FileExistsError:
+                        pass
+                    os.unlink(temp)
+                with open(path) as f:
+                    _host_id = f.read().strip()
+                _remove_stale_files()
+            except OSError as e:
+                print(f"Shared-memory transport disabled: {e}")
+    return _host_id or None
+
+def _remove_stale_files():
+    """Unlink the SHM_DIR files of senders in our PID namespace that died before releasing them
+
+    Containers sharing SHM_DIR usually have PID namespaces of their own, so
+    files from another namespace are left to the nodes of that namespace.
+    """
+    if _PID_NAMESPACE is None:
+        return
+    removed = 0
+    for name in os.listdir(SHM_DIR):
+        namespace, _, rest = name.partition("-")
+        pid = rest.split("-")[0]
+        if not name.endswith(".blk") or namespace != _PID_NAMESPACE or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            release_shared([os.path.join(SHM_DIR, name)])
+            removed += 1
+        except PermissionError:
+            pass  # Alive, under another user
+    if removed:
+        print(f"Removed {removed} files left in {SHM_DIR} by senders that are gone")
+
+def is_local_peer(host_id):
+    """Check whether a peer reporting host_id can read matrices from our SHM_DIR"""
+    return host_id is not None and host_id == shm_host_id()
+
+def _write_shared(array):
+    """Copy an array into a new file in SHM_DIR, returning (name, path)"""
+    name = f"{_PID_NAMESPACE or 0}-{os.getpid()}-{uuid.uuid4().hex}.blk"
+    path = os.path.join(SHM_DIR, name)
+    try:
+        with open(path, "wb") as f:
+            f.write(_raw_bytes(array))
+    except OSError:
+        release_shared([path])
+        raise
+    return name, path
+
+def _map_shared(name, dtype, count):
+    """View the matrix stored in a SHM_DIR file without copying it"""
+    with open(os.path.join(SHM_DIR, os.path.basename(name)), "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(buffer, dtype=dtype, count=count)
+
+def release_shared(paths):
+    """Unlink the files written for a request (receivers keep any mapping they made)"""
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def _narrow(array):
+    """Return array in the smallest integer dtype that holds its values exactly, or None if that saves nothing"""
+    if array.size == 0 or array.dtype.kind not in "iuf":
+        return None
+    if array.dtype.kind == "f":
+        # Most float matrices are not integer-valued, which a few elements usually show
+        sample = array.reshape(-1)[:64]
+        if not (np.isfinite(sample).all() and (sample == np.rint(sample)).all()):
+            return None
+    low, high = array.min(), array.max()
+    if array.dtype.kind == "f" and not (np.isfinite(low) and np.isfinite(high) and -2 ** 31 <= low and high < 2 ** 31):
+        return None
+    dtype = np.result_type(np.min_scalar_type(int(low)), np.min_scalar_type(int(high)))
+    if dtype.itemsize >= array.dtype.itemsize:
+        return None
+    narrowed = array.astype(dtype)
+    if array.dtype.kind == "f" and not np.array_equal(narrowed, array):
+        return None
+    # -0.0 compares equal to 0, but would arrive as +0.0
+    if array.dtype.kind == "f" and low <= 0 <= high and np.signbit(array[array == 0]).any():
+        return None
+    return narrowed
+
+def _compressible(buffer):
+    """Check whether slices spread over a buffer deflate to COMPRESS_RATIO, so a frame that will not is never deflated whole"""
+    step = len(buffer) // 4
+    if step <= COMPRESS_SAMPLE_BYTES:
+        return True
+    sample = b"".join(bytes(buffer[i * step:i * step + COMPRESS_SAMPLE_BYTES]) for i in range(4))
+    return len(zlib.compress(sample, COMPRESS_LEVEL)) <= COMPRESS_RATIO * len(sample)
+
+def _encode_frame(array, codecs):
+    """Apply the codecs that pay off to a matrix, returning (descriptor fields, buffer) or None if none did"""
+    fields = {"encoding": []}
+    values = array
+    buffer = None
+
+    if "narrow" in codecs:
+        narrowed = _narrow(array)
+        if narrowed is not None:
+            values = narrowed
+            fields["encoding"].append("narrow")
+    fields["stored_dtype"] = values.dtype.str
+
+    if "csr" in codecs and values.ndim == 2 and values.size:
+        nnz = np.count_nonzero(values)
+        if nnz <= SPARSE_DENSITY * values.size:
+            rows, cols = np.nonzero(values)
+            index_dtype = np.dtype(np.int32 if max(values.shape) < 2 ** 31 else np.int64)
+            indptr = np.zeros(values.shape[0] + 1, dtype=index_dtype)
+            np.cumsum(np.bincount(rows, minlength=values.shape[0]), out=indptr[1:])
+            buffer = b"".join([indptr.tobytes(), cols.astype(index_dtype).tobytes(), values[rows, cols].tobytes()])
+            fields["encoding"].append("csr")
+            fields["nnz"] = int(nnz)
+            fields["index_dtype"] = index_dtype.str
+
+    if buffer is None:
+        buffer = _raw_bytes(np.ascontiguousarray(values))
+
+    if "zlib" in codecs and len(buffer) >= COMPRESS_MIN_BYTES and _compressible(buffer):
+        compressed = zlib.compress(buffer, COMPRESS_LEVEL)
+        if len(compressed) <= COMPRESS_RATIO * len(buffer):
+            buffer = compressed
+            fields["encoding"].append("zlib")
+
+    if not fields["encoding"]:
+        return None
+    return fields, buffer
+
+def _decode_frame(frame, buffer):
+    """Rebuild a matrix from an encoded frame's buffer"""
+    dtype = np.dtype(frame["dtype"])
+    stored_dtype = np.dtype(frame["stored_dtype"])
+    shape = frame["shape"]
+    encoding = frame["encoding"]
+
+    if "zlib" in encoding:
+        buffer = zlib.decompress(buffer)
+
+    if "csr" in encoding:
+        nnz = frame["nnz"]
+        index_dtype = np.dtype(frame["index_dtype"])
+        indptr = np.frombuffer(buffer, dtype=index_dtype, count=shape[0] + 1)
+        cols_start = indptr.nbytes
+        cols = np.frombuffer(buffer, dtype=index_dtype, count=nnz, offset=cols_start)
+        values = np.frombuffer(buffer, dtype=stored_dtype, count=nnz, offset=cols_start + cols.nbytes)
+        matrix = np.zeros(shape, dtype=dtype)
+        matrix[np.repeat(np.arange(shape[0]), np.diff(indptr)), cols] = values
+        return matrix
+
+    matrix = np.frombuffer(buffer, dtype=stored_dtype, count=int(np.prod(shape))).reshape(shape)
+    return matrix.astype(dtype) if stored_dtype != dtype else matrix
+
+def encode_frames(meta, matrices, shared_files=None, codecs=None, stats=None):
+    """Pack JSON metadata and a list of matrices into a single binary body
+
+    If shared_files is a list, matrices of at least SHM_MIN_BYTES are written
+    to SHM_DIR instead of the body and their paths appended to it; the caller
+    must pass them to release_shared once the request is answered.
+
+    Inline matrices are encoded with codecs (WIRE_CODECS by default). If
+    stats is a Counter, the sizes, encodings and encode time of the inline
+    frames are added to it.
+    """
+    codecs = WIRE_CODECS if codecs is None else codecs
+    buffers = []
+    frames = []
+    offset = 0
+    codec_seconds = 0.0
+    for matrix in matrices:
+        array = np.ascontiguousarray(matrix)
+        if array.dtype.hasobject:
+            raise ValueError("Object arrays cannot be sent as binary frames")
+        if shared_files is not None and array.nbytes >= SHM_MIN_BYTES:
+            try:
+                name, path = _write_shared(array)
+            except OSError as e:
+                # SHM_DIR is full or gone, so this matrix goes in the body
+                print(f"Sending matrix inline: {e}")
+            else:
+                shared_files.append(path)
+                frames.append({
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "shm": name,
+                    "nbytes": array.nbytes
+                })
+                continue
+
+        frame = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        start = time.perf_counter()
+        encoded = _encode_frame(array, codecs) if codecs else None
+        codec_seconds += time.perf_counter() - start
+        if encoded is not None:
+            fields, buffer = encoded
+            frame.update(fields)
+            if stats is not None:
+                stats.update(fields["encoding"])
+        else:
+            buffer = _raw_bytes(array)
+        frame["nbytes"] = len(buffer)
+        frames.append(frame)
+        buffers.append((frame, buffer))
+        offset = _align(offset + frame["nbytes"])
+        if stats is not None:
+            stats.update(frames=1, raw_bytes=array.nbytes, wire_bytes=frame["nbytes"])
+
+    header = {"meta": meta, "frames": frames}
+    if codec_seconds and any("encoding" in frame for frame in frames):
+        # Lets the receiver account for the time spent on both ends
+        header["codec_seconds"] = codec_seconds
+        if stats is not None:
+            stats.update(encode_seconds=codec_seconds)
+    header = json.dumps(header).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    parts = [_PREFIX.pack(MAGIC, len(header)), header, b"\0" * (data_start - _PREFIX.size - len(header))]
+    for frame, buffer in buffers:
+        parts.append(buffer)
+        parts.append(b"\0" * (_align(frame["nbytes"]) - frame["nbytes"]))
+    return b"".join(parts)
+
+class FrameStream:
+    """A binary body produced chunk by chunk from the matrices, for operands too large to copy whole
+
+    Frames are left unencoded, so the header (and the body length) follows
+    from the shapes alone, and each matrix is read a slab of rows at a time.
+    A memory-mapped matrix is therefore only paged in as it is sent. The
+    length lets requests send a Content-Length instead of chunked encoding.
+    """
+    def __init__(self, meta, matrices, chunk_bytes=8 << 20):
+        self.matrices = []
+        frames = []
+        offset = 0
+        for matrix in matrices:
+            array = np.asanyarray(matrix)
+            if array.dtype.hasobject:
+                raise ValueError("Object arrays cannot be sent as binary frames")
+            frames.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset, "nbytes": array.nbytes})
+            self.matrices.append(array)
+            offset = _align(offset + array.nbytes)
+
+        header = json.dumps({"meta": meta, "frames": frames}).encode()
+        data_start = _align(_PREFIX.size + len(header))
+        self.head = _PREFIX.pack(MAGIC, len(header)) + header + b"\0" * (data_start - _PREFIX.size - len(header))
+        self.length = data_start + offset
+        self.chunk_bytes = max(chunk_bytes, 1)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        yield self.head
+        for array in self.matrices:
+            rows = array.reshape(len(array), -1) if array.ndim > 1 and array.size else array.reshape(-1, 1)
+            step = max(1, self.chunk_bytes // max(rows.shape[1] * array.itemsize, 1))
+            for start in range(0, len(rows), step):
+                # Only this slab is copied, and only if the matrix is not C-ordered
+                yield memoryview(np.ascontiguousarray(rows[start:start + step])).cast("B")
+            yield b"\0" * (_align(array.nbytes) - array.nbytes)
+
+def decode_frames(body, stats=None):
+    """Unpack a binary body into (meta, matrices) without copying the matrix data of plain frames
+
+    If stats is a Counter, the sizes, encodings and codec time of the inline
+    frames (including the sender's encode time) are added to it.
+    """
+    if len(body) < _PREFIX.size:
+        raise ValueError("Body is too short to contain a frame header")
+    magic, header_len = _PREFIX.unpack_from(body, 0)
+    if magic != MAGIC:
+        raise ValueError("Body is not a binary matrix payload")
+
+    header = json.loads(bytes(body[_PREFIX.size:_PREFIX.size + header_len]))
+    data_start = _align(_PREFIX.size + header_len)
+
+    matrices = []
+    decode_seconds = 0.0
+    for frame in header["frames"]:
+        dtype = np.dtype(frame["dtype"])
+        if "shm" in frame:
+            try:
+                matrix = _map_shared(frame["shm"], dtype, frame["nbytes"] // dtype.itemsize)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Shared frame {frame['shm']} is unavailable: {e}")
+            matrices.append(matrix.reshape(frame["shape"]))
+            continue
+        start = data_start + frame["offset"]
+        if start + frame["nbytes"] > len(body):
+            raise ValueError("Frame extends past the end of the body")
+        if stats is not None:
+            stats.update(frame.get("encoding", []))
+            stats.update(frames=1, raw_bytes=int(np.prod(frame["shape"])) * dtype.itemsize, wire_bytes=frame["nbytes"])
+        if frame.get("encoding"):
+            began = time.perf_counter()
+            try:
+                matrices.append(_decode_frame(frame, memoryview(body)[start:start + frame["nbytes"]]))
+            except (KeyError, TypeError, ValueError, zlib.error) as e:
+                raise ValueError(f"Encoded frame is malformed: {e}")
+            decode_seconds += time.perf_counter() - began
+            continue
+        count = frame["nbytes"] // dtype.itemsize
+        matrix = np.frombuffer(body, dtype=dtype, count=count, offset=start)
+        matrices.append(matrix.reshape(frame["shape"]))
+
+    if stats is not None:
+        stats.update(encode_seconds=header.get("codec_seconds", 0.0), decode_seconds=decode_seconds)
+    return header["meta"], matrices
+
+def to_json_payload(meta, matrices, matrix_keys):
+    """Build a JSON body: metadata, each matrix as a nested list, and their dtypes under the dtypes key"""
+    payload = dict(meta)
+    for key, matrix in zip(matrix_keys, matrices):
+        payload[key] = np.asarray(matrix).tolist()
+    payload["dtypes"] = {key: np.asarray(matrix).dtype.str for key, matrix in zip(matrix_keys, matrices)}
+    return payload
+
+def from_json_payload(data, matrix_keys):
+    """Split a JSON body into (meta, matrices), restoring dtypes when the sender included them"""
+    data = dict(data or {})
+    dtypes = data.pop("dtypes", None) or {}
+    matrices = [np.array(data.pop(key), dtype=dtypes.get(key)) for key in matrix_keys if key in data]
+    return data, matrices
+
+def is_binary(req):
+    """Check whether a Flask request carries a binary matrix payload"""
+    return req.mimetype == CONTENT_TYPE
+
+def read_payload(req, matrix_keys, stats=None):
+    """Return (meta, matrices) from a binary or JSON request body
+
+    JSON bodies carry each matrix as a nested list under the matching key in
+    matrix_keys (missing keys are skipped); every other key is returned as
+    metadata.
+    """
+    if is_binary(req):
+        return decode_frames(req.get_data(), stats)
+    return from_json_payload(req.get_json(), matrix_keys)
+
+def requested_codecs(req):
+    """Codecs a Flask request says its sender can decode in the response, among the ones we use"""
+    accepted = req.headers.get(CODECS_HEADER, "").lower().split(",")
+    return [name for name in WIRE_CODECS if name in accepted]
+
+def encode_response(req, meta, matrices, matrix_keys, stats=None):
+    """Build (body, content_type) for a response in the format and codecs the requester accepts"""
+    if req.accept_mimetypes.best_match([CONTENT_TYPE, "application/json"]) == CONTENT_TYPE:
+        return encode_frames(meta, matrices, codecs=requested_codecs(req), stats=stats), CONTENT_TYPE
+    return json.dumps(to_json_payload(meta, matrices, matrix_keys)), "application/json"
+
+def read_response(response, matrix_keys, stats=None):
+    """Return (meta, matrices) from a requests response in either format"""
+    if response.headers.get("Content-Type", "").split(";")[0] == CONTENT_TYPE:
+        return decode_frames(response.content, stats)
+    return from_json_payload(response.json(), matrix_keys)
+
+def accept_header():
+    """Accept header asking for responses in the configured wire format, with the codecs we can decode"""
+    if WIRE_FORMAT == "json":
+        return {"Accept": "application/json"}
+    return {"Accept": f"{CONTENT_TYPE}, application/json;q=0.5", CODECS_HEADER: ",".join(ENCODINGS)}
+
+def post_matrices(session, url, meta, matrices, matrix_keys, shared=False, stats=None, chunk_bytes=0, **kwargs):
+    """POST metadata and matrices using the configured wire format
+
+    With shared set (the receiver is a local peer), large matrices go
+    through SHM_DIR instead of the body. Inline matrices are encoded with
+    WIRE_CODECS, and their codec stats added to stats if it is a Counter.
+    With chunk_bytes, the body is instead streamed unencoded in chunks of
+    about that size (see FrameStream).
+    """
+    if WIRE_FORMAT == "json":
+        return session.post(url, json=to_json_payload(meta, matrices, matrix_keys), **kwargs)
+
+    if chunk_bytes:
+        return session.post(url, data=FrameStream(meta, matrices, chunk_bytes), headers={"Content-Type": CONTENT_TYPE}, **kwargs)
+
+    shared_files = [] if shared else None
+    try:
+        return session.post(
+            url,
+            data=encode_frames(meta, matrices, shared_files, stats=stats),
+            headers={"Content-Type": CONTENT_TYPE},
+            **kwargs
+        )
+    finally:
+        release_shared(shared_files or [])
@@ -1,11 +1,29 @@
 import os
 import time
+
+# Tasks run on a bounded "thread" or "process" pool of EXECUTOR_WORKERS; at most
+# EXECUTOR_QUEUE tasks may be running or waiting before /process answers 503
+EXECUTOR = os.environ.get('EXECUTOR', 'thread').lower()
+EXECUTOR_WORKERS = int(os.environ.get('EXECUTOR_WORKERS', 0)) or os.cpu_count() or 1
+EXECUTOR_QUEUE = int(os.environ.get('EXECUTOR_QUEUE', 0)) or 4 * EXECUTOR_WORKERS
+# Seconds a busy worker asks the coordinator to wait before sending again
+RETRY_AFTER = int(os.environ.get('RETRY_AFTER', 1))
+# BLAS threads per running task, so concurrent tasks share the cores instead of
+# oversubscribing them. BLAS reads these when NumPy is imported, so set them first.
+BLAS_THREADS = int(os.environ.get('BLAS_THREADS', 0)) or max(1, (os.cpu_count() or 1) // EXECUTOR_WORKERS)
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, str(BLAS_THREADS))
+
 import numpy as np
 from flask import Flask, request, jsonify
 import threading
 import logging
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from utils import Task, TaskType, split_matrix, join_matrices, create_retry_session
+from utils import TaskType, PEEL_KEYS, WorkspacePool, strassen_products, strassen_combine, peel_corrections, local_strassen, batch_levels, batched_strassen, is_sparse_product, sparse_multiply, is_zero_matrix, product_shape, create_retry_session, read_task, read_task_response
+from wire import post_matrices, read_payload, accept_header, shm_host_id, is_local_peer
 
 
 app = Flask(__name__)
@@ -20,21 +38,157 @@ COORDINATOR_PORT = int(os.environ.get('COORDINATOR_PORT', 5000))
 COORDINATOR_URL = f"http://{COORDINATOR_HOST}:{COORDINATOR_PORT}"
 WORKER_URL = f"http://worker{NODE_ID}:{PORT}" if NODE_ID != 'coordinator' else f"http://localhost:{PORT}"
 MIN_MULTIPLY = int(os.environ.get('MIN_MULT', 2))
+# Measure the cutoffs below from GEMM throughput and network bandwidth at startup
+AUTO_CUTOFF = os.environ.get('AUTO_CUTOFF', '1') == '1'
+# Largest matrix size multiplied while measuring local GEMM throughput
+CUTOFF_PROBE_MAX = int(os.environ.get('CUTOFF_PROBE_MAX', 512))
+# Bytes posted to the coordinator while measuring network bandwidth
+BANDWIDTH_PROBE_BYTES = int(os.environ.get('BANDWIDTH_PROBE_BYTES', 4 << 20))
+
+# Subproblems whose smallest dimension is at most DIST_CUTOFF are not distributed any further;
+# locally, Strassen recursion continues down to BLAS_CUTOFF and then uses a single GEMM.
+# Explicit values override the measured ones; without AUTO_CUTOFF both default to MIN_MULT.
+DIST_CUTOFF = int(os.environ.get('DIST_CUTOFF', 0)) or MIN_MULTIPLY
+BLAS_CUTOFF = int(os.environ.get('BLAS_CUTOFF', 0)) or DIST_CUTOFF
+# Subproblems whose smallest dimension is at most BATCH_CUTOFF (and above DIST_CUTOFF) are not
+# distributed either. If every dimension is, the whole subtree is computed here with its leaf
+# products in one stacked matmul; a tall-skinny one is a single GEMM (0 disables)
+BATCH_CUTOFF = int(os.environ.get('BATCH_CUTOFF', 128))
+# Dtypes whose BLAS cutoff is measured separately (the first also sets the reported throughput).
+# Integer GEMM has no BLAS kernel, so its crossover sits far below the float ones.
+CUTOFF_DTYPES = [np.dtype(name) for name in os.environ.get('CUTOFF_DTYPES', 'float64,float32,int64').split(',') if name]
+# Map dtype name to its BLAS cutoff; BLAS_CUTOFF_<DTYPE> (e.g. BLAS_CUTOFF_FLOAT32) sets one explicitly
+BLAS_CUTOFFS = {key[len('BLAS_CUTOFF_'):].lower(): int(value) for key, value in os.environ.items() if key.startswith('BLAS_CUTOFF_') and value}
+PROFILE = {}  # Measurements reported to the coordinator on /register
+# Whether the coordinator shares this worker's SHM_DIR (learned on /register)
+COORDINATOR_LOCAL = False
+# Relative capacity used by the coordinator's scheduler (0 = measured GEMM throughput)
+WEIGHT = float(os.environ.get('WEIGHT', 0))
+
+# Combines this worker collects directly from other workers (routing mode)
+pending_combines = {}  # Map parent task_id to {results, count, expected, peel, next_route}
+finished_combines = OrderedDict()  # Recently combined slots, so late copies of their results are dropped
+FINISHED_COMBINES_KEPT = 1024
+combine_lock = threading.Lock()
+# Send the 7 products of a split in one /return_batch request instead of 7 /return requests
+BATCH_RETURN = os.environ.get('BATCH_RETURN', '1') == '1'
+# Tasks worked on at once when pulling from the coordinator's /next (pull mode)
+PULL_SLOTS = int(os.environ.get('PULL_SLOTS', 0)) or EXECUTOR_WORKERS
+# Seconds each /next request may be held open waiting for a task
+PULL_WAIT = float(os.environ.get('PULL_WAIT', 20))
+# Seconds between heartbeats to the coordinator
+HEARTBEAT_INTERVAL = float(os.environ.get('HEARTBEAT_INTERVAL', 5))
+# Bytes of idle scratch arrays kept for reuse by the split, combine and local Strassen kernels
+WORKSPACE_BYTES = int(os.environ.get('WORKSPACE_BYTES', 256 << 20))
+workspace = WorkspacePool(WORKSPACE_BYTES)
+# Products with an operand at most this dense are computed whole with the sparse kernel (0 disables)
+SPARSE_CUTOFF = float(os.environ.get('SPARSE_CUTOFF', 0.05))
+
+def best_time(func, repeats=3):
+    """Best wall time of func() over a few runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def blas_cutoff(dtype):
+    """Size at or below which local Strassen recursion hands matrices of dtype to a single GEMM"""
+    return BLAS_CUTOFFS.get(np.dtype(dtype).name, BLAS_CUTOFF)
+
+def measure_gemm(dtype=np.float64):
+    """Measure local GEMM throughput (operations per second) and the size where Strassen starts to pay off
+
+    Returns (ops_per_second, strassen_size), where strassen_size is the smallest
+    size at which one local Strassen level beats a single GEMM (None if it
+    never does up to CUTOFF_PROBE_MAX).
+    """
+    ops_per_second = 0
+    strassen_size = None
+    n = 32
+    while n <= CUTOFF_PROBE_MAX:
+        a = np.random.randint(0, 10, size=(n, n)).astype(dtype)
+        b = np.random.randint(0, 10, size=(n, n)).astype(dtype)
+
+        direct = best_time(lambda: a @ b)
+        one_level = best_time(lambda: workspace.give(local_strassen(a, b, n // 2, workspace)))
+
+        ops_per_second = 2 * n ** 3 / direct
+        if strassen_size is None and one_level < direct:
+            strassen_size = n
+        n *= 2
+    return ops_per_second, strassen_size
+
+def measure_network():
+    """Measure (bytes_per_second, latency_seconds) of requests to the coordinator"""
+    payload = b"\0" * BANDWIDTH_PROBE_BYTES
+    latency = best_time(lambda: session.post(f"{COORDINATOR_URL}/probe", data=b"", timeout=10))
+    transfer = best_time(lambda: session.post(f"{COORDINATOR_URL}/probe", data=payload, timeout=30))
+    return BANDWIDTH_PROBE_BYTES / max(transfer - latency, 1e-6), latency
+
+def distribution_cutoff(ops_per_second, bytes_per_second, latency, itemsize=4):
+    """Smallest power-of-2 size whose local multiply takes longer than sending it out as a subtask
+
+    A distributed subproblem crosses the coordinator twice: both operands go
+    out and the result comes back (3 n^2 elements each way), plus about three
+    request latencies.
+    """
+    n = 2
+    while n < 1 << 16:
+        compute = 2 * n ** 3 / ops_per_second
+        transfer = 2 * 3 * n * n * itemsize / bytes_per_second + 3 * latency
+        if compute >= transfer:
+            return n
+        n *= 2
+    return n
+
+def calibrate_cutoffs():
+    """Derive DIST_CUTOFF and the BLAS cutoffs from measured GEMM throughput and network bandwidth"""
+    global DIST_CUTOFF, BLAS_CUTOFF
+
+    measured = {dtype.name: measure_gemm(dtype) for dtype in CUTOFF_DTYPES}
+    ops_per_second, strassen_size = measured[CUTOFF_DTYPES[0].name]
+    bytes_per_second, latency = measure_network()
+    PROFILE.update(gops=ops_per_second / 1e9, bandwidth=bytes_per_second, latency=latency)
+
+    if 'DIST_CUTOFF' not in os.environ:
+        DIST_CUTOFF = max(distribution_cutoff(ops_per_second, bytes_per_second, latency, CUTOFF_DTYPES[0].itemsize), MIN_MULTIPLY)
+
+    # Local recursion only pays off above the size where one Strassen level beats GEMM
+    for name, (_, size) in measured.items():
+        if name not in BLAS_CUTOFFS:
+            BLAS_CUTOFFS[name] = min(size // 2, DIST_CUTOFF) if size else DIST_CUTOFF
+    if 'BLAS_CUTOFF' not in os.environ:
+        BLAS_CUTOFF = BLAS_CUTOFFS[CUTOFF_DTYPES[0].name]
+
+    print(f"Worker {NODE_ID} measured {PROFILE['gops']:.2f} Gop/s, {bytes_per_second / 1e6:.1f} MB/s, "
+          f"{latency * 1000:.1f} ms latency -> distribution cutoff {DIST_CUTOFF}, BLAS cutoffs {BLAS_CUTOFFS}")
 
 def register_with_coordinator():
-    """Register this worker with the coordinator"""
+    """Register this worker with the coordinator, returning its dispatch mode ("push" or "pull") or False"""
+    global COORDINATOR_LOCAL
     try:
         response = session.post(
             f"{COORDINATOR_URL}/register",
             json={
                 'worker_id': NODE_ID,
-                'worker_url': WORKER_URL
+                'worker_url': WORKER_URL,
+                'dist_cutoff': DIST_CUTOFF,
+                'batch_cutoff': BATCH_CUTOFF,
+                'blas_cutoff': BLAS_CUTOFF,
+                'blas_cutoffs': BLAS_CUTOFFS,
+                'weight': WEIGHT or PROFILE.get('gops', 1.0),
+                'shm_host': shm_host_id(),
+                **PROFILE
             },
             timeout=10
         )
         if response.status_code == 200:
-            print(f"Successfully registered with coordinator as worker {NODE_ID}")
-            return True
+            data = response.json()
+            COORDINATOR_LOCAL = is_local_peer(data.get('shm_host'))
+            print(f"Successfully registered with coordinator as worker {NODE_ID}" + (" (shared memory)" if COORDINATOR_LOCAL else ""))
+            return data.get('dispatch_mode', 'push')
         else:
             print(f"Failed to register with coordinator: {response.status_code}")
             return False
@@ -42,15 +196,19 @@ def register_with_coordinator():
         print(f"Error registering with coordinator: {e}")
         return False
 
-def send_result_to_coordinator(task_id, result):
-    """Send task result back to coordinator"""
+def send_result_to_coordinator(task_id, result, source_id=None):
+    """Send task result back to coordinator (source_id names the task that produced it, if different)"""
+    meta = {'task_id': task_id}
+    if source_id:
+        meta['source_id'] = source_id
     try:
-        response = session.post(
+        response = post_matrices(
+            session,
             f"{COORDINATOR_URL}/result",
-            json={
-                'task_id': task_id,
-                'result': result.tolist()
-            },
+            meta,
+            [result],
+            ['result'],
+            shared=COORDINATOR_LOCAL,
             timeout=(5, 120)
         )
         return response.status_code == 200
@@ -58,108 +216,425 @@ def send_result_to_coordinator(task_id, result):
         print(f"Error sending result to coordinator: {e}")
         return False
 
+def deliver_result(route, result):
+    """Send a result straight to the worker collecting it for a combine"""
+    try:
+        response = post_matrices(
+            session,
+            f"{route['url']}/deliver",
+            {'slot': route['slot'], 'm_number': route['m_number']},
+            [result],
+            ['result'],
+            shared=is_local_peer(route.get('shm_host')),
+            # Deliveries are only stored on arrival, so a slow answer means a dead peer
+            timeout=(5, 10)
+        )
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error delivering result to {route['url']}: {e}")
+        return False
+
+def notify_completed(task_ids):
+    """Tell the coordinator that routed tasks are done (their results went elsewhere)"""
+    try:
+        session.post(f"{COORDINATOR_URL}/complete", json={'task_ids': task_ids}, timeout=10)
+    except Exception as e:
+        print(f"Error notifying coordinator: {e}")
+
+def finish_task(task, result):
+    """Send a finished task's result along its route, or to the coordinator if it has none"""
+    if not task.route:
+        return send_result_to_coordinator(task.task_id, result)
+
+    delivered = deliver_result(task.route, result)
+    if delivered:
+        notify_completed([task.task_id])
+    return delivered
+
 def process_multiply_task(task):
     """Process a top-level multiplication task, breaking it down using Strassen's algorithm"""
     matrix_a, matrix_b = task.matrices
-    task_id = task.task_id
+
+    # A zero factor makes the whole product zero, so skip the work entirely
+    if is_zero_matrix(matrix_a) or is_zero_matrix(matrix_b):
+        shape, dtype = product_shape(matrix_a, matrix_b)
+        return finish_task(task, np.zeros(shape, dtype=dtype))
+
+    # A mostly-zero operand makes the product cheap to compute directly, however large it is
+    if is_sparse_product(matrix_a, matrix_b, SPARSE_CUTOFF):
+        return finish_task(task, sparse_multiply(matrix_a, matrix_b, SPARSE_CUTOFF))
     
-    # Check if we can use direct multiplication (1x1 matrices or base case)
-    if matrix_a.shape[0] <= MIN_MULTIPLY or matrix_a.shape[1] <= MIN_MULTIPLY or matrix_b.shape[1] <= MIN_MULTIPLY:
-        result = matrix_a @ matrix_b
-        return send_result_to_coordinator(task_id, result)
+    # Below the distribution cutoff a round trip costs more than computing locally,
+    # recursing with Strassen's algorithm until the BLAS cutoff
+    if min(matrix_a.shape[0], matrix_a.shape[1], matrix_b.shape[1]) <= DIST_CUTOFF:
+        shape, dtype = product_shape(matrix_a, matrix_b)
+        result = local_strassen(matrix_a, matrix_b, blas_cutoff(matrix_a.dtype), workspace, workspace.take(shape, dtype))
+        sent = finish_task(task, result)
+        workspace.give(result)
+        return sent
+
+    # A small subtree costs a request per leaf when distributed, far more than its
+    # arithmetic, so expand it here and multiply all its leaves at once
+    if min(matrix_a.shape[0], matrix_a.shape[1], matrix_b.shape[1]) <= BATCH_CUTOFF:
+        if max(matrix_a.shape[0], matrix_a.shape[1], matrix_b.shape[1]) <= BATCH_CUTOFF:
+            levels = batch_levels(matrix_a, matrix_b, blas_cutoff(matrix_a.dtype))
+            return finish_task(task, batched_strassen(matrix_a, matrix_b, levels))
+        # A tall-skinny product would be padded and stacked along its long sides, so one GEMM is far cheaper
+        return finish_task(task, matrix_a @ matrix_b)
     
     # If not, we perform strassen's algorithm
-    # Split matrices into quadrants
-    a11, a12, a21, a22 = split_matrix(matrix_a)
-    b11, b12, b21, b22 = split_matrix(matrix_b)
-    
-    # Create the 7 products required by Strassen's algorithm
-    products = [
-        # M1 = (A11 + A22) * (B11 + B22)
-        [np.add(a11, a22), np.add(b11, b22)],
-        
-        # M2 = (A21 + A22) * B11
-        [np.add(a21, a22), b11],
-        
-        # M3 = A11 * (B12 - B22)
-        [a11, np.subtract(b12, b22)],
-        
-        # M4 = A22 * (B21 - B11)
-        [a22, np.subtract(b21, b11)],
-        
-        # M5 = (A11 + A12) * B22
-        [np.add(a11, a12), b22],
-        
-        # M6 = (A21 - A11) * (B11 + B12)
-        [np.subtract(a21, a11), np.add(b11, b12)],
-        
-        # M7 = (A12 - A22) * (B21 + B22)
-        [np.subtract(a12, a22), np.add(b21, b22)]
-    ]
+    products = strassen_products(matrix_a, matrix_b, workspace)
+    peel = peel_corrections(matrix_a, matrix_b)
+    try:
+        return send_subtasks(task, products, peel)
+    finally:
+        # Sending copied the operand sums out, so their buffers can be reused (quadrant views are ignored)
+        workspace.give(*[matrix for product in products for matrix in product])
+
+def process_tile_task(task):
+    """Compute one tile of C as the sum of its K-block products [A_i0 @ B_0j + A_i1 @ B_1j + ...]"""
+    pairs = list(zip(task.matrices[::2], task.matrices[1::2]))
+    shape, dtype = product_shape(*pairs[0])
+
+    # Pairs with a zero factor add nothing to the tile
+    pairs = [(a, b) for a, b in pairs if not (is_zero_matrix(a) or is_zero_matrix(b))]
+    if not pairs:
+        return finish_task(task, np.zeros(shape, dtype=dtype))
+
+    result = workspace.take(shape, dtype)
+    partial = workspace.take(shape, dtype) if len(pairs) > 1 else None
+    for i, (matrix_a, matrix_b) in enumerate(pairs):
+        out = result if i == 0 else partial
+        if is_sparse_product(matrix_a, matrix_b, SPARSE_CUTOFF):
+            out[...] = sparse_multiply(matrix_a, matrix_b, SPARSE_CUTOFF)
+        else:
+            local_strassen(matrix_a, matrix_b, blas_cutoff(matrix_a.dtype), workspace, out)
+        if i > 0:
+            result += partial
+
+    sent = finish_task(task, result)
+    workspace.give(*[matrix for matrix in (result, partial) if matrix is not None])
+    return sent
+
+def send_subtasks(task, products, peel):
+    """Send the 7 products of a split (and any peel corrections) to the coordinator"""
+    task_id = task.task_id
+
+    # Routed tasks must split through the batch endpoint, the only one that routes
+    if BATCH_RETURN or task.route:
+        return return_subtasks_batch(task, products, peel)
+
+    # Odd dimensions leave a row/column outside the quadrants; the combine needs
+    # their corrections, so they must reach the coordinator before any product
+    if peel:
+        post_matrices(
+            session,
+            f"{COORDINATOR_URL}/peel",
+            {'task_id': task_id, 'peel_keys': list(peel)},
+            list(peel.values()),
+            list(peel),
+            shared=COORDINATOR_LOCAL
+        )
     
     for i, product in enumerate(products):
+        meta = {'parent_id': task_id, 'm_number': i, 'job_id': task.job_id}
+
+        # Products with a zero factor only need their shape, not their operands
+        zero = zero_product_meta(product)
+        if zero:
+            meta.update(zero)
+            product = []
+
         # Send each subtask back to coordinator for processing
-        # In a real implementation, we might want to batch these
-        session.post(
+        post_matrices(
+            session,
             f"{COORDINATOR_URL}/return",
-            json={
-                'matrix_a': product[0].tolist(),
-                'matrix_b': product[1].tolist(),
-                'parent_id': task_id,
-                'm_number': i
-            }
+            meta,
+            product,
+            ['matrix_a', 'matrix_b'],
+            shared=COORDINATOR_LOCAL
         )
     
     return True
 
+def zero_product_meta(product):
+    """Shape metadata standing in for a product with a zero factor, or None"""
+    if is_zero_matrix(product[0]) or is_zero_matrix(product[1]):
+        shape, dtype = product_shape(*product)
+        return {'zero_shape': list(shape), 'zero_dtype': dtype.str}
+    return None
+
+def return_subtasks_batch(task, products, peel):
+    """Send all 7 products of a split (and any peel corrections) to the coordinator in one request"""
+    entries = []
+    frames = []
+    keys = []
+    for i, product in enumerate(products):
+        entry = {'m_number': i}
+        zero = zero_product_meta(product)
+        if zero:
+            entry.update(zero)
+        else:
+            frames.extend(product)
+            keys.extend([f"matrix_a_{i}", f"matrix_b_{i}"])
+        entries.append(entry)
+
+    frames.extend(peel.values())
+    keys.extend(peel)
+
+    try:
+        response = post_matrices(
+            session,
+            f"{COORDINATOR_URL}/return_batch",
+            {'parent_id': task.task_id, 'job_id': task.job_id, 'products': entries, 'peel_keys': list(peel)},
+            frames,
+            keys,
+            shared=COORDINATOR_LOCAL,
+            timeout=(5, 120)
+        )
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error returning subtasks to coordinator: {e}")
+        return False
+
 def process_strassen_combine_task(task):
     """Combine the 7 results from Strassen's algorithm subtasks"""
     results = task.subtasks_results
     task_id = task.task_id
     parent_id = task.parent_id
     
-    # Get the 7 product matrices
-    m1, m2, m3, m4, m5, m6, m7 = results
-    
-    # Calculate the quadrants of the result matrix
-    c11 = m1 + m4 - m5 + m7
-    c12 = m3 + m5
-    c21 = m2 + m4
-    c22 = m1 - m2 + m3 + m6
-    
-    # Join the quadrants to form the final result
-    result = join_matrices(c11, c12, c21, c22)
+    # Combine the 7 product matrices into the result
+    result = strassen_combine(results, task.peel, workspace)
     
     # Send the result back to the coordinator
-    return send_result_to_coordinator(parent_id if parent_id else task_id, result)
+    sent = send_result_to_coordinator(parent_id if parent_id else task_id, result, source_id=task_id)
+    workspace.give(result)
+    return sent
+
+def finish_routed_combine(slot, entry):
+    """Combine the 7 results collected for slot and pass the product on"""
+    result = strassen_combine(entry['results'], entry['peel'], workspace)
+    if entry['next_route']:
+        if deliver_result(entry['next_route'], result):
+            notify_completed([slot])
+    else:
+        send_result_to_coordinator(slot, result)
+    workspace.give(result)
+
+def combine_entry(slot):
+    """Get or create the collection entry for slot (caller holds combine_lock)"""
+    if slot not in pending_combines:
+        pending_combines[slot] = {'results': [None] * 7, 'count': 0, 'expected': False, 'peel': None, 'next_route': None}
+    return pending_combines[slot]
+
+def start_combine_if_ready(slot):
+    """Start the combine for slot once the plan and all 7 results have arrived"""
+    with combine_lock:
+        entry = pending_combines.get(slot)
+        ready = entry is not None and entry['expected'] and entry['count'] == 7
+        if ready:
+            del pending_combines[slot]
+            finished_combines[slot] = True
+            if len(finished_combines) > FINISHED_COMBINES_KEPT:
+                finished_combines.popitem(last=False)
+
+    if ready:
+        # Already accepted work, so it bypasses the queue limit
+        executor.submit(finish_routed_combine, slot, entry).add_done_callback(log_task_error)
+
+def fill_combine_slot(slot, m_number, result):
+    """Store one result collected for slot"""
+    with combine_lock:
+        # Another copy of the same subtask (re-dispatched or speculative) already completed it
+        if slot in finished_combines:
+            return
+        entry = combine_entry(slot)
+        if entry['results'][m_number] is None:
+            entry['results'][m_number] = result
+            entry['count'] += 1
+    start_combine_if_ready(slot)
+
+@app.route('/expect', methods=['POST'])
+def expect_combine():
+    """Endpoint for the coordinator to announce a combine this worker will collect results for"""
+    try:
+        data, matrices = read_payload(request, PEEL_KEYS)
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
+    slot = data.get('slot')
+    if not slot:
+        return jsonify({'error': 'Missing slot'}), 400
+
+    with combine_lock:
+        # The split was announced again after being redone; start over
+        finished_combines.pop(slot, None)
+        entry = combine_entry(slot)
+        entry['peel'] = dict(zip(data.get('peel_keys', []), matrices)) or None
+        entry['next_route'] = data.get('next_route')
+        entry['expected'] = True
+
+    # Products with a zero factor never run, so their slots are filled here
+    for zero in data.get('zeros', []):
+        shape, dtype = tuple(zero['zero_shape']), zero['zero_dtype']
+        fill_combine_slot(slot, zero['m_number'], np.zeros(shape, dtype=dtype))
+
+    # Deliveries can arrive before the announcement, so they may all be in already
+    start_combine_if_ready(slot)
+    return jsonify({'status': 'expecting'}), 200
+
+@app.route('/deliver', methods=['POST'])
+def deliver():
+    """Endpoint for other workers to deliver a result for a combine collected here"""
+    try:
+        data, matrices = read_payload(request, ['result'])
+    except ValueError:
+        return jsonify({'error': 'Malformed matrix payload'}), 400
+    slot = data.get('slot')
+    m_number = data.get('m_number')
+    if not slot or m_number is None or len(matrices) != 1:
+        return jsonify({'error': 'Invalid delivery'}), 400
+
+    fill_combine_slot(slot, m_number, matrices[0])
+    return jsonify({'status': 'received'}), 200
+
+TASK_HANDLERS = {
+    TaskType.MULTIPLY: process_multiply_task,
+    TaskType.TILE: process_tile_task,
+    TaskType.COMBINE: process_strassen_combine_task
+}
+
+executor = None  # Created by start_executor once the cutoffs are known
+task_slots = threading.BoundedSemaphore(EXECUTOR_QUEUE)
+
+def init_task_process(dist_cutoff, blas_cutoff, blas_cutoffs, coordinator_local):
+    """Carry the measured cutoffs and the coordinator's locality into a pool process"""
+    global DIST_CUTOFF, BLAS_CUTOFF, COORDINATOR_LOCAL
+    DIST_CUTOFF, BLAS_CUTOFF, COORDINATOR_LOCAL = dist_cutoff, blas_cutoff, coordinator_local
+    BLAS_CUTOFFS.update(blas_cutoffs)
+
+def start_executor():
+    """Create the task executor"""
+    global executor
+    if EXECUTOR == 'process':
+        # Spawned rather than forked, so pool processes do not inherit the server socket
+        executor = ProcessPoolExecutor(
+            max_workers=EXECUTOR_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_task_process,
+            initargs=(DIST_CUTOFF, BLAS_CUTOFF, BLAS_CUTOFFS, COORDINATOR_LOCAL)
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+
+def log_task_error(future):
+    """Report an exception raised by a task on the executor"""
+    if future.exception() is not None:
+        print(f"Error processing task: {future.exception()}")
+
+def release_slot(future):
+    """Free the queue slot of a finished task"""
+    task_slots.release()
+    log_task_error(future)
+
+def queue_task(task, block=False):
+    """Run a task on the bounded executor, returning its future (None if the queue is full)"""
+    if executor is None or not task_slots.acquire(blocking=block):
+        return None
+    future = executor.submit(TASK_HANDLERS[task.task_type], task)
+    future.add_done_callback(release_slot)
+    return future
 
 @app.route('/process', methods=['POST'])
 def process_task():
     """Endpoint for processing a task"""
-    data = request.json
-    task = Task.from_dict(data)
+    try:
+        task = read_task(request)
+    except ValueError:
+        return jsonify({'error': 'Malformed task payload'}), 400
     
     print(f"Worker {NODE_ID} processing task {task.task_id} of type {task.task_type.value}")
     
     # Process the task based on its type
-    if task.task_type == TaskType.MULTIPLY:
-        threading.Thread(target=process_multiply_task, args=(task,)).start()
-    elif task.task_type == TaskType.COMBINE:
-        threading.Thread(target=process_strassen_combine_task, args=(task,)).start()
-    else:
+    if task.task_type not in TASK_HANDLERS:
         return jsonify({'error': 'Unknown task type'}), 400
+    if queue_task(task) is None:
+        return jsonify({'error': 'Worker is busy'}), 503, {'Retry-After': str(RETRY_AFTER)}
     
     return jsonify({'status': 'processing'}), 200
 
+def pull_loop():
+    """Take tasks from the coordinator's ready queue one at a time, only as fast as this loop finishes them"""
+    while True:
+        try:
+            response = session.get(
+                f"{COORDINATOR_URL}/next",
+                params={'worker_id': NODE_ID, 'wait': PULL_WAIT},
+                headers=accept_header(),
+                timeout=PULL_WAIT + 10
+            )
+        except Exception as e:
+            print(f"Error pulling task from coordinator: {e}")
+            time.sleep(1)
+            continue
+
+        # Nothing was ready within the wait
+        if response.status_code == 204:
+            continue
+        if response.status_code != 200:
+            print(f"Error pulling task from coordinator: {response.status_code}")
+            time.sleep(1)
+            continue
+
+        task = read_task_response(response)
+        print(f"Worker {NODE_ID} pulled task {task.task_id} of type {task.task_type.value}")
+        # Wait for a free slot and for the task itself, so this loop never runs ahead of the executor
+        try:
+            queue_task(task, block=True).result()
+        except Exception as e:
+            print(f"Error processing task {task.task_id}: {e}")
+
+def heartbeat_loop():
+    """Tell the coordinator this worker is alive, registering again if it has been dropped"""
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            response = session.post(f"{COORDINATOR_URL}/heartbeat", json={'worker_id': NODE_ID}, timeout=5)
+            if response.status_code == 404:
+                print(f"Coordinator no longer knows worker {NODE_ID}, registering again")
+                register_with_coordinator()
+        except Exception as e:
+            print(f"Error sending heartbeat: {e}")
+
 def register_loop():
     """Keep trying to register with the coordinator"""
+    calibrated = not AUTO_CUTOFF
     registered = False
     while not registered:
+        if not calibrated:
+            try:
+                calibrate_cutoffs()
+                calibrated = True
+            except Exception as e:
+                print(f"Error measuring cutoffs: {e}")
+                time.sleep(5)
+                continue
         registered = register_with_coordinator()
         if not registered:
             print(f"Will retry registration in 5 seconds...")
             time.sleep(5)
 
+    # Started after registering so pool processes know whether the coordinator is local;
+    # tasks arriving in between are answered 503 and sent again
+    if executor is None:
+        start_executor()
+
+    threading.Thread(target=heartbeat_loop, daemon=True).start()
+
+    # In pull mode the coordinator never pushes; each slot takes one task at a time
+    if registered == 'pull':
+        for _ in range(PULL_SLOTS):
+            threading.Thread(target=pull_loop, daemon=True).start()
+
 if __name__ == '__main__':
     print(f"Starting worker node (ID: {NODE_ID}) on port {PORT}")
     
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import contextlib
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+# Sets the coordinator's configuration for an in-process run, so it comes first
+from fake_worker import pull_task, result_body
+import coordinator
+from wire import CONTENT_TYPE, encode_frames, decode_frames
+
+def run_worker(worker_id, done, latencies, errors):
+    """Pull tasks from /next and post their results to /result until every job is done"""
+    client = coordinator.app.test_client()
+    while not done.is_set():
+        task = pull_task(client, worker_id, 0.2)
+        if task is None:
+            continue
+        body = result_body(task)
+
+        start = time.perf_counter()
+        response = client.post('/result', data=body, content_type=CONTENT_TYPE)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+def benchmark(jobs, size, depth, threads, workers):
+    """Submit planned jobs, then have threads pull and report every task at once, returning the timing summary"""
+    client = coordinator.app.test_client()
+    for i in range(workers):
+        client.post('/register', json={'worker_id': f'w{i}', 'worker_url': f'http://w{i}', 'dist_cutoff': 1})
+
+    matrices = []
+    job_ids = []
+    for _ in range(jobs):
+        a = np.random.randint(0, 10, size=(size, size))
+        b = np.random.randint(0, 10, size=(size, size))
+        body = encode_frames({'decomposition': 'strassen', 'planner_depth': depth}, [a, b], codecs=())
+        response = client.post('/submit', data=body, content_type=CONTENT_TYPE)
+        job_ids.append(response.get_json()['task_id'])
+        matrices.append((a, b))
+
+    done = threading.Event()
+    latencies = []
+    errors = []
+    pool = [threading.Thread(target=run_worker, args=(f'w{i % workers}', done, latencies, errors)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for job_id in job_ids:
+        coordinator.result_store.wait(job_id, 600, lambda job_id: job_id in coordinator.jobs)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in pool:
+        thread.join()
+
+    for job_id, (a, b) in zip(job_ids, matrices):
+        response = client.get(f'/jobs/{job_id}/result', headers={'Accept': CONTENT_TYPE})
+        assert response.status_code == 200, f"job {job_id} did not finish"
+        assert np.array_equal(decode_frames(response.data)[1][0], a @ b), f"job {job_id} has a wrong result"
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'posts': len(latencies),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'posts_per_second': len(latencies) / elapsed,
+        'p50_ms': np.percentile(latencies, 50),
+        'p99_ms': np.percentile(latencies, 99),
+        'max_ms': latencies.max()
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Drive thousands of concurrent result posts through an in-process coordinator and report throughput and latency.')
+    parser.add_argument('--jobs', '-j', type=int, default=8, help='Planned jobs submitted before the run')
+    parser.add_argument('--size', '-n', type=int, default=128, help='Square matrix size of each job')
+    parser.add_argument('--depth', '-d', type=int, default=3, help='Planner depth (each job reports 7^d leaves and their combines)')
+    parser.add_argument('--threads', '-t', type=int, default=64, help='Concurrent threads pulling tasks and posting results')
+    parser.add_argument('--workers', '-w', type=int, default=8, help='Fake workers registered with the coordinator')
+    parser.add_argument('--csv', '-c', help='Optional CSV file to append results to')
+
+    args = parser.parse_args()
+
+    # The coordinator logs every task; keep that out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        stats = benchmark(args.jobs, args.size, args.depth, args.threads, args.workers)
+
+    print(f"{'threads':>8} {'posts':>7} {'errors':>7} {'seconds':>8} {'posts/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print(f"{args.threads:>8} {stats['posts']:>7} {stats['errors']:>7} {stats['seconds']:>8.2f} {stats['posts_per_second']:>9.0f} "
+          f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f}")
+
+    if args.csv:
+        with open(args.csv, "a") as f:
+            f.write(",".join(str(x) for x in [args.threads, args.jobs, args.size, args.depth] + list(stats.values())) + "\n")
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+from utils import WorkspacePool, split_matrix, strassen_products, strassen_combine, local_strassen
+
+def reference_products(a, b):
+    """The split as it was before the fused kernels: 10 freshly allocated sums"""
+    a11, a12, a21, a22 = split_matrix(a)
+    b11, b12, b21, b22 = split_matrix(b)
+    return [
+        [a11 + a22, b11 + b22], [a21 + a22, b11], [a11, b12 - b22], [a22, b21 - b11],
+        [a11 + a12, b22], [a21 - a11, b11 + b12], [a12 - a22, b21 + b22]
+    ]
+
+def reference_combine(results):
+    """The combine as it was before the fused kernels: 4 quadrant temporaries joined into a new matrix"""
+    m1, m2, m3, m4, m5, m6, m7 = results
+    c11 = m1 + m4 - m5 + m7
+    c12 = m3 + m5
+    c21 = m2 + m4
+    c22 = m1 - m2 + m3 + m6
+    rows, cols = c11.shape
+    result = np.zeros((2 * rows, 2 * cols), dtype=c11.dtype)
+    result[:rows, :cols] = c11
+    result[:rows, cols:] = c12
+    result[rows:, :cols] = c21
+    result[rows:, cols:] = c22
+    return result
+
+def reference_strassen(a, b, cutoff):
+    """Local Strassen recursion as it was before the fused kernels"""
+    if min(a.shape[0], a.shape[1], b.shape[1]) <= cutoff:
+        return a @ b
+    return reference_combine([reference_strassen(x, y, cutoff) for x, y in reference_products(a, b)])
+
+def measure(func, repeats):
+    """Return (best wall time in ms, peak traced allocation in bytes, result) of func()"""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    del result
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak, result
+
+def benchmark(size, cutoff, dtype, repeats):
+    """Compare the reference and fused kernels on size x size matrices"""
+    a = np.random.randint(-9, 10, size=(size, size)).astype(dtype)
+    b = np.random.randint(-9, 10, size=(size, size)).astype(dtype)
+    results = [np.random.randint(-9, 10, size=(size // 2, size // 2)).astype(dtype) for _ in range(7)]
+    pool = WorkspacePool()
+
+    def pooled_split():
+        products = strassen_products(a, b, pool)
+        pool.give(*[matrix for product in products for matrix in product])
+        return products
+
+    def pooled_combine():
+        result = strassen_combine(results, pool=pool)
+        pool.give(result)
+        return result
+
+    def pooled_multiply():
+        result = local_strassen(a, b, cutoff, pool, pool.take((size, size), dtype))
+        pool.give(result)
+        return result
+
+    kernels = [
+        ("split", lambda: reference_products(a, b), pooled_split),
+        ("combine", lambda: reference_combine(results), pooled_combine),
+        ("multiply", lambda: reference_strassen(a, b, cutoff), pooled_multiply)
+    ]
+
+    rows = []
+    for name, reference, fused in kernels:
+        fused()  # Warm the pool, as a worker's would be after its first task
+        reference_ms, reference_peak, expected = measure(reference, repeats)
+        fused_ms, fused_peak, actual = measure(fused, repeats)
+        if name != "split":
+            assert np.allclose(expected, actual)
+        rows.append((size, name, reference_ms, fused_ms, reference_peak, fused_peak))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare time and peak memory of the reference and fused (pooled, Strassen-Winograd) kernels.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[256, 512, 1024, 2048], help='Square matrix sizes to test')
+    parser.add_argument('--cutoff', type=int, default=64, help='BLAS cutoff of the local multiply')
+    parser.add_argument('--dtype', '-d', default='float64', help='Matrix dtype')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='Runs per measurement (best is reported)')
+    parser.add_argument('--csv', '-c', help='Optional CSV file to append results to')
+
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'kernel':>9} {'ref ms':>10} {'fused ms':>10} {'ref peak MB':>12} {'fused peak MB':>14}")
+    results = []
+    for size in args.sizes:
+        for row in benchmark(size, args.cutoff, args.dtype, args.repeats):
+            results.append(row)
+            print(f"{row[0]:>6} {row[1]:>9} {row[2]:>10.2f} {row[3]:>10.2f} {row[4] / 1e6:>12.2f} {row[5] / 1e6:>14.2f}")
+
+    if args.csv:
+        with open(args.csv, "a") as f:
+            for row in results:
+                f.write(",".join(str(x) for x in row) + "\n")
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+import utils
+from utils import WorkspacePool, local_strassen, sparse_multiply
+
+def time_call(func, repeats):
+    """Return the best wall time of func() over several runs, in milliseconds, and its last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def sparse_matrix(rows, cols, density, dtype):
+    """Random small integers with only a density fraction of the entries non-zero"""
+    matrix = np.random.randint(1, 10, size=(rows, cols)).astype(dtype)
+    matrix[np.random.random((rows, cols)) >= density] = 0
+    return matrix
+
+def benchmark(size, density, cutoff, dtype, repeats, both=False):
+    """Time the dense Strassen path and the sparse kernels on a size x size product with a sparse left operand"""
+    a = sparse_matrix(size, size, density, dtype)
+    b = sparse_matrix(size, size, density if both else 1.0, dtype)
+    pool = WorkspacePool()
+    scipy_module = utils.sparse
+
+    def numpy_sparse():
+        utils.sparse = None
+        try:
+            return sparse_multiply(a, b, 1.0)
+        finally:
+            utils.sparse = scipy_module
+
+    kernels = [
+        ("strassen", lambda: local_strassen(a, b, cutoff, pool)),
+        ("numpy", numpy_sparse)
+    ]
+    if scipy_module is not None:
+        kernels.append(("scipy", lambda: sparse_multiply(a, b, 1.0)))
+
+    expected = a @ b
+    timings = {}
+    for name, kernel in kernels:
+        timings[name], result = time_call(kernel, repeats)
+        assert np.allclose(result, expected)
+    return timings
+
+def plot(rows, names, output_file, size):
+    """Chart runtime against density for every kernel (needs matplotlib)"""
+    import matplotlib.pyplot as plt
+
+    densities = sorted(set(row[1] for row in rows))
+    plt.figure(figsize=(10, 6))
+    for name in names:
+        plt.plot(densities, [row[3] for row in rows if row[2] == name], marker='o', label=name)
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.xlabel('Density of the sparse operand')
+    plt.ylabel('Computation Time (milliseconds)')
+    plt.title(f'Dense Strassen vs Sparse Kernels ({size}x{size})')
+    plt.legend()
+    plt.grid(linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig(output_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare runtime of the dense Strassen path and the sparse kernels as density changes.')
+    parser.add_argument('densities', nargs='*', type=float, default=[0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5], help='Densities of the sparse operand to test')
+    parser.add_argument('--size', '-n', type=int, default=1024, help='Square matrix size')
+    parser.add_argument('--cutoff', type=int, default=64, help='BLAS cutoff of the dense Strassen path')
+    parser.add_argument('--dtype', '-d', default='float64', help='Matrix dtype')
+    parser.add_argument('--both', '-b', action='store_true', help='Make both operands sparse instead of only the left one')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='Runs per measurement (best is reported)')
+    parser.add_argument('--csv', '-c', help='Optional CSV file to append results to')
+    parser.add_argument('--plot', '-p', help='Optional image file to chart the results to (needs matplotlib)')
+
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'density':>8} {'kernel':>9} {'ms':>10} {'vs strassen':>12}")
+    results = []
+    names = []
+    for density in args.densities:
+        timings = benchmark(args.size, density, args.cutoff, args.dtype, args.repeats, args.both)
+        names = list(timings)
+        for name, ms in timings.items():
+            results.append((args.size, density, name, ms))
+            print(f"{args.size:>6} {density:>8.3f} {name:>9} {ms:>10.2f} {timings['strassen'] / ms:>11.1f}x")
+
+    if args.csv:
+        with open(args.csv, "a") as f:
+            for row in results:
+                f.write(",".join(str(x) for x in row) + "\n")
+
+    if args.plot:
+        plot(results, names, args.plot, args.size)
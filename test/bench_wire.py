@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+from wire import WIRE_CODECS, encode_frames, decode_frames, release_shared
+
+def time_call(func, repeats):
+    """Return the best wall time of func() over several runs, in milliseconds"""
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def json_encode(a, b):
+    return json.dumps({'matrix_a': a.tolist(), 'matrix_b': b.tolist()}).encode()
+
+def json_decode(body):
+    data = json.loads(body)
+    return np.array(data['matrix_a']), np.array(data['matrix_b'])
+
+def binary_encode(a, b):
+    return encode_frames({}, [a, b], codecs=())
+
+def encoded_encode(a, b):
+    return encode_frames({}, [a, b], codecs=WIRE_CODECS)
+
+def binary_decode(body):
+    return decode_frames(body)[1]
+
+def shared_encode(a, b):
+    files = []
+    body = encode_frames({}, [a, b], files, codecs=())
+    shared_files.extend(files)
+    return body
+
+shared_files = []  # Written by shared_encode, released after each measurement
+
+def benchmark(size, repeats, shared=False, density=1.0):
+    """Compare the JSON, binary and encoded (and shared-memory) wire formats for one pair of size x size matrices
+
+    With density below 1, only that fraction of each matrix (its top-left corner, like padding) is nonzero.
+    """
+    a = np.random.randint(0, 10, size=(size, size)).astype(np.int32)
+    b = np.random.randint(0, 10, size=(size, size)).astype(np.int32)
+    if density < 1:
+        corner = int(size * density ** 0.5)
+        a[corner:, :] = 0
+        a[:, corner:] = 0
+        b[corner:, :] = 0
+        b[:, corner:] = 0
+
+    rows = []
+    formats = [("json", json_encode, json_decode), ("binary", binary_encode, binary_decode), ("encoded", encoded_encode, binary_decode)]
+    if shared:
+        formats.append(("shared", shared_encode, binary_decode))
+    for name, encode, decode in formats:
+        encode_ms, body = time_call(lambda: encode(a, b), repeats)
+        decode_ms, (a2, b2) = time_call(lambda: decode(body), repeats)
+        assert (a2 == a).all() and (b2 == b).all()
+        rows.append((size, name, len(body), encode_ms, decode_ms))
+        del a2, b2
+        release_shared(shared_files)
+        shared_files.clear()
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare bytes on the wire and encode/decode time of the JSON, binary and encoded (WIRE_CODECS) matrix formats.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[256, 512, 1024, 2048], help='Square matrix sizes to test')
+    parser.add_argument('--repeats', '-r', type=int, default=3, help='Runs per measurement (best is reported)')
+    parser.add_argument('--csv', '-c', help='Optional CSV file to append results to')
+    parser.add_argument('--shared', '-s', action='store_true', help='Also measure the shared-memory transport used between peers on one host')
+    parser.add_argument('--density', type=float, default=1.0, help='Fraction of each matrix that is nonzero (the rest is zero padding)')
+
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'format':>8} {'bytes':>14} {'encode ms':>11} {'decode ms':>11}")
+    results = []
+    for size in args.sizes:
+        for row in benchmark(size, args.repeats, args.shared, args.density):
+            results.append(row)
+            print(f"{row[0]:>6} {row[1]:>8} {row[2]:>14,} {row[3]:>11.2f} {row[4]:>11.2f}")
+
+    if args.csv:
+        with open(args.csv, "a") as f:
+            for row in results:
+                f.write(",".join(str(x) for x in row) + "\n")
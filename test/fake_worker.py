@@ -0,0 +1,37 @@
+import os
+import sys
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+# The coordinator reads its configuration at import, so this module is imported first:
+# queue tasks for pulling instead of sending them, keep results off the disk and never
+# back up a task that is just slow
+os.environ.setdefault('DISPATCH_MODE', 'pull')
+os.environ.setdefault('RESULT_FORMATS', '')
+os.environ.setdefault('SPECULATE', '0')
+
+from utils import Task, TaskType, strassen_combine
+from wire import CONTENT_TYPE, encode_frames
+
+def compute(task):
+    """The result a worker would report for a pulled task"""
+    if task.task_type == TaskType.COMBINE:
+        return strassen_combine(task.subtasks_results, task.peel)
+    return sum(a @ b for a, b in zip(task.matrices[::2], task.matrices[1::2]))
+
+def pull_task(client, worker_id, wait=0):
+    """Pull a task from the coordinator's /next as worker_id, or None if none was ready within wait seconds"""
+    response = client.get(f'/next?worker_id={worker_id}&wait={wait}', headers={'Accept': CONTENT_TYPE})
+    if response.status_code == 204:
+        return None
+    return Task.from_bytes(response.data)
+
+def result_body(task):
+    """The /result body a worker would post for a pulled task"""
+    # A combine reports its parent's result under the parent's ID
+    meta = {'task_id': task.task_id}
+    if task.task_type == TaskType.COMBINE:
+        meta = {'task_id': task.parent_id or task.task_id, 'source_id': task.task_id}
+    return encode_frames(meta, [compute(task)], codecs=())
@@ -22,19 +22,22 @@ def generate_worker(id: int, network="csce689-project-network", image:str=None,
                              f"MIN_MULT={min_mult}"]
     return worker
 
-def generate_coordinator(network="csce689-project-network"):
+def generate_coordinator(network="csce689-project-network", planner_depth=0, scheduler="least_loaded", dispatch_mode="push"):
     coordinator = {"build": ".",
                    "ports": ["5000:5000"],
                    "command": "python -u coordinator.py",
                    "volumes": ["./app/:/app"],
                    "networks": [network],
                    "environment": ["NODE_ID=coordinator",
-                                   "PORT=5000"]}
+                                   "PORT=5000",
+                                   f"PLANNER_DEPTH={planner_depth}",
+                                   f"SCHEDULER={scheduler}",
+                                   f"DISPATCH_MODE={dispatch_mode}"]}
     return coordinator
 
-def generate_services(network="csce689-project-network", num_of_workers=7, images=list(), min_mult=16):
+def generate_services(network="csce689-project-network", num_of_workers=7, images=list(), min_mult=16, planner_depth=0, scheduler="least_loaded", dispatch_mode="push"):
     services = dict()
-    services["coordinator"] = generate_coordinator(network)
+    services["coordinator"] = generate_coordinator(network, planner_depth, scheduler, dispatch_mode)
 
     for i in range(num_of_workers):
         image = None
@@ -63,10 +66,13 @@ def main(default_file=None):
         num_of_workers = data['num_of_workers']
         images = data['images']
         min_mult = data['min_mult']
+        planner_depth = data.get('planner_depth', 0)
+        scheduler = data.get('scheduler', 'least_loaded')
+        dispatch_mode = data.get('dispatch_mode', 'push')
 
         docker = dict()
         docker["networks"] = generate_network() 
-        docker["services"] = generate_services(num_of_workers=num_of_workers, images=images, min_mult=min_mult)
+        docker["services"] = generate_services(num_of_workers=num_of_workers, images=images, min_mult=min_mult, planner_depth=planner_depth, scheduler=scheduler, dispatch_mode=dispatch_mode)
     else:
         print("Welcome to the Docker Compose Generator!")
         use_file = input("Would you like to read a configuration from a file? (y|n): ")
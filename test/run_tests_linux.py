@@ -1,5 +1,7 @@
 import os
 import time
+import json
+import requests
 from rich.console import Console
 
 console = Console()
@@ -9,8 +11,10 @@ def run(command: str, output=False):
         command += " > /dev/null 2>&1"
     return os.system(command)
 
-def run_client(parameters:str, log_file: str, output=False):
+def run_client(parameters:str, log_file: str, output=False, decomposition=None):
     command = f"python app/client.py http://localhost:5000 {parameters} -l {log_file}"
+    if decomposition:
+        command = f"DECOMPOSITION={decomposition} {command}"
     return run(command, output=output)
 
 def complete(a):
@@ -26,12 +30,12 @@ def create_docker(generator_file, output=False):
         run("docker compose up -d --build", output=output)
     console.print("[green]Docker initiated!")
 
-def perform_tests(test_name, tests, log_file):
+def perform_tests(test_name, tests, log_file, decomposition=None):
     failed_tests = False
     with console.status("[bold yellow]Running tests...") as status:
         for i, test in enumerate(tests):
             name, command, expectation = test
-            result = run_client(command, log_file)
+            result = run_client(command, log_file, decomposition=decomposition)
             if expectation(result):
                 console.print(f"[green] Test {i + 1} - {name} succeeded!")
             else:
@@ -42,6 +46,19 @@ def perform_tests(test_name, tests, log_file):
     else:
         console.print(f"[green]All {test_name} tests succeeded!\n\n")
 
+def save_scheduler_stats(log_file):
+    """Print the coordinator's scheduler counters and save them next to the log file"""
+    try:
+        stats = requests.get("http://localhost:5000/scheduler", timeout=5).json()
+    except Exception as e:
+        console.print(f"[red]Could not fetch scheduler stats: {e}")
+        return
+    console.print(f"Scheduler policy: {stats['policy']}")
+    for worker_id, worker in stats['workers'].items():
+        console.print(f"  worker {worker_id}: {worker['dispatched']} tasks, {worker['bytes_sent']:,} bytes, weight {worker['weight']:.2f}")
+    with open(os.path.splitext(log_file)[0] + "_scheduler.json", "w") as f:
+        json.dump(stats, f, indent=2)
+
 def clear_docker():
     with console.status("[bold yellow]Closing existing Docker containers..."):
         run("docker compose kill")
@@ -66,7 +83,8 @@ if __name__ == '__main__':
                5 : "Large scale system (diagnostic)",
                6 : "Large scale system (performance)",
                7 : "Very large scale system (diagnostic)",
-               8 : "Very large scale system (performance)"}
+               8 : "Very large scale system (performance)",
+               9 : "Large scale system (Strassen vs tiled)"}
 
     while True:
         for num, option in options.items():
@@ -92,6 +110,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("small scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 2:
                 test = ("16x16 @ 16x16", "16,16 16,16", complete)
                 tests = [test] * 20
@@ -102,6 +121,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("small scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 3:
                 tests = [("16x16 @ 16x16", "16,16 16,16", complete), 
                          ("17x13 @ 13x19", "17,13 13,19", complete),
@@ -119,7 +139,8 @@ if __name__ == '__main__':
                 create_docker(generator_file)
                 clear_log_file(log_file)
                 time.sleep(1)
-                perform_tests("medium scale diagnostic", tests, log_file) 
+                perform_tests("medium scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 4:
                 test = ("128x128 @ 128x128", "128,128 128,128", complete)
                 tests = [test] * 20
@@ -130,6 +151,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("medium scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 5:
                 tests = [("256x256 @ 256x256", "256,256 256,256", complete), 
                          ("512x512 @ 512x512", "512,512 512,512", complete),
@@ -143,6 +165,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("large scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 6:
                 test = ("2048x2048 @ 2048x2048", "2048,2048 2048,2048", complete)
                 tests = [test] * 20
@@ -153,6 +176,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("large scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 7:
                 tests = [("2048x2048 @ 2048x2048", "2048,2048 2048,2048", complete), 
                          ("4096x4096 @ 4096x4096", "4096,4096 4096,4096", complete),
@@ -164,6 +188,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("very large scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 8:
                 test = ("8192x8192 @ 8192x8192", "8192,8192 8192,8192", complete)
                 tests = [test] * 20
@@ -174,5 +199,19 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("very large scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
+            case 9:
+                tests = [("1024x1024 @ 1024x1024", "1024,1024 1024,1024", complete),
+                         ("2048x2048 @ 2048x2048", "2048,2048 2048,2048", complete),
+                         ("1000x3000 @ 3000x1000", "1000,3000 3000,1000", complete),]
+                generator_file = "test/generators/large_scale.json"
+
+                create_docker(generator_file)
+                time.sleep(1)
+                for decomposition in ("strassen", "tiles"):
+                    log_file = f"test/logs/large_scale_{decomposition}.csv"
+                    clear_log_file(log_file)
+                    perform_tests(f"large scale {decomposition}", tests * 5, log_file, decomposition)
+                    save_scheduler_stats(log_file)
             case _:
                 console.print("[bold red]Invalid option! Try again")
\ No newline at end of file
@@ -1,5 +1,7 @@
 import os
 import time
+import json
+import requests
 from rich.console import Console
 
 console = Console()
@@ -43,6 +45,19 @@ def perform_tests(test_name, tests, log_file):
     else:
         console.print(f"[green]All {test_name} tests succeeded!\n\n")
 
+def save_scheduler_stats(log_file):
+    """Print the coordinator's scheduler counters and save them next to the log file"""
+    try:
+        stats = requests.get("http://localhost:5000/scheduler", timeout=5).json()
+    except Exception as e:
+        console.print(f"[red]Could not fetch scheduler stats: {e}")
+        return
+    console.print(f"Scheduler policy: {stats['policy']}")
+    for worker_id, worker in stats['workers'].items():
+        console.print(f"  worker {worker_id}: {worker['dispatched']} tasks, {worker['bytes_sent']:,} bytes, weight {worker['weight']:.2f}")
+    with open(os.path.splitext(log_file)[0] + "_scheduler.json", "w") as f:
+        json.dump(stats, f, indent=2)
+
 def clear_docker():
     with console.status("[bold yellow]Closing existing Docker containers..."):
         run("docker-compose kill")
@@ -93,6 +108,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("small scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 2:
                 test = ("16x16 @ 16x16", "16,16 16,16", complete)
                 tests = [test] * 20
@@ -103,6 +119,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("small scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 3:
                 tests = [("16x16 @ 16x16", "16,16 16,16", complete), 
                          ("17x13 @ 13x19", "17,13 13,19", complete),
@@ -120,7 +137,8 @@ if __name__ == '__main__':
                 create_docker(generator_file)
                 clear_log_file(log_file)
                 time.sleep(1)
-                perform_tests("medium scale diagnostic", tests, log_file) 
+                perform_tests("medium scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 4:
                 test = ("128x128 @ 128x128", "128,128 128,128", complete)
                 tests = [test] * 20
@@ -131,6 +149,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("medium scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 5:
                 tests = [("256x256 @ 256x256", "256,256 256,256", complete), 
                          ("512x512 @ 512x512", "512,512 512,512", complete),
@@ -144,6 +163,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("large scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 6:
                 test = ("2048x2048 @ 2048x2048", "2048,2048 2048,2048", complete)
                 tests = [test] * 20
@@ -154,6 +174,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("large scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case 7:
                 tests = [("2048x2048 @ 2048x2048", "2048,2048 2048,2048", complete), 
                          ("4096x4096 @ 4096x4096", "4096,4096 4096,4096", complete),
@@ -165,6 +186,7 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("very large scale diagnostic", tests, log_file)
+                save_scheduler_stats(log_file)
             case 8:
                 test = ("8192x8192 @ 8192x8192", "8192,8192 8192,8192", complete)
                 tests = [test] * 20
@@ -175,5 +197,6 @@ if __name__ == '__main__':
                 clear_log_file(log_file)
                 time.sleep(1)
                 perform_tests("very large scale performance", tests, log_file)
+                save_scheduler_stats(log_file)
             case _:
                 console.print("[bold red]Invalid option! Try again")
\ No newline at end of file
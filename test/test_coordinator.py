@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+# Sets the coordinator's test configuration, so it comes first
+from fake_worker import pull_task, result_body
+import coordinator
+from coordinator import ProductCache, ResultSlots, ResultStore
+from utils import Task, TaskType
+from wire import CONTENT_TYPE, encode_frames, decode_frames
+
+def run_pulled_tasks(client, worker_id):
+    """Pull every queued task and report its result as a worker would, returning the /result status codes"""
+    statuses = []
+    task = pull_task(client, worker_id)
+    while task is not None:
+        statuses.append(client.post('/result', data=result_body(task), content_type=CONTENT_TYPE).status_code)
+        task = pull_task(client, worker_id)
+    return statuses
+
+def test_result_slot_ignores_a_second_fill_of_the_same_result():
+    slots = ResultSlots(2)
+    shared = np.ones((2, 2))
+    assert slots.fill(0, shared) is None
+    assert slots.fill(0, shared) is None
+    results = slots.fill(1, np.zeros((2, 2)))
+    assert results[0] is shared and not results[1].any()
+
+def test_identical_jobs_submitted_concurrently():
+    client = coordinator.app.test_client()
+    # With a single worker a row split would be a single block, replaced by strassen
+    for i in range(3):
+        client.post('/register', json={'worker_id': f'identical{i}', 'worker_url': f'http://identical{i}', 'dist_cutoff': 1})
+    a = np.random.randint(0, 10, size=(300, 40))
+    b = np.random.randint(0, 10, size=(40, 50))
+    body = encode_frames({'decomposition': 'rows'}, [a, b], codecs=())
+
+    responses = []
+    submitters = [threading.Thread(target=lambda: responses.append(client.post('/submit', data=body, content_type=CONTENT_TYPE))) for _ in range(3)]
+    for thread in submitters:
+        thread.start()
+    for thread in submitters:
+        thread.join()
+    assert [response.status_code for response in responses] == [200] * 3
+
+    assert set(run_pulled_tasks(client, 'identical0')) == {200}
+    job_id = responses[0].get_json()['task_id']
+    response = client.get(f'/jobs/{job_id}/result', headers={'Accept': CONTENT_TYPE})
+    assert response.status_code == 200
+    assert np.array_equal(decode_frames(response.data)[1][0], a @ b)
+
+def test_result_store_keeps_newest_oversized_result():
+    store = ResultStore(max_entries=4, max_bytes=100, ttl=60)
+    store.put('small', result=np.zeros(4))
+    store.put('large', result=np.zeros(1000))
+    assert store.get('large') is not None
+    assert store.get('small') is None
+
+def test_failed_job_is_stored_before_it_stops_running():
+    seen = []
+    job_id = 'failing-job'
+    coordinator.jobs[job_id] = coordinator.Job(job_id)
+    put = coordinator.result_store.put
+
+    def checking_put(job_id, **kwargs):
+        seen.append(job_id in coordinator.jobs)
+        put(job_id, **kwargs)
+
+    coordinator.result_store.put = checking_put
+    try:
+        coordinator.fail_job(job_id, 'boom')
+    finally:
+        coordinator.result_store.put = put
+    assert seen == [True]
+    assert job_id not in coordinator.jobs
+    assert coordinator.result_store.get(job_id)['error'] == 'boom'
+
+def test_result_wait_is_validated():
+    client = coordinator.app.test_client()
+    for wait in ['abc', 'nan']:
+        assert client.get(f'/jobs/unknown/result?wait={wait}').status_code == 400
+    assert client.get('/jobs/unknown/result?wait=-5').status_code == 404
+
+def test_result_reported_during_the_send_settles_the_lease():
+    client = coordinator.app.test_client()
+    client.post('/register', json={'worker_id': 'fast', 'worker_url': 'http://fast', 'dist_cutoff': 1})
+    send = coordinator.send_task_to_worker
+
+    def reporting_send(worker_url, task, shared=False):
+        # The worker answers before the coordinator has seen the send return
+        assert task.task_id in coordinator.leases
+        coordinator.settle_task(task.task_id)
+        return True, None
+
+    def failing_send(worker_url, task, shared=False):
+        return False, None
+
+    for fake_send in [reporting_send, failing_send]:
+        task = Task(task_type=TaskType.MULTIPLY, matrices=[np.random.rand(3, 3), np.random.rand(3, 3)])
+        coordinator.register_task(task)
+        coordinator.send_task_to_worker = fake_send
+        try:
+            coordinator.send_dispatch(coordinator.Dispatch(task))
+        finally:
+            coordinator.send_task_to_worker = send
+            coordinator.active_tasks.pop(task.task_id, None)
+        assert task.task_id not in coordinator.leases
+
+def test_a_product_returned_twice_is_dispatched_once():
+    client = coordinator.app.test_client()
+    a, b = np.random.rand(3, 3), np.random.rand(3, 3)
+    body = encode_frames({'parent_id': 'split-twice', 'm_number': 0}, [a, b], codecs=())
+    first = client.post('/return', data=body, content_type=CONTENT_TYPE).get_json()
+    second = client.post('/return', data=body, content_type=CONTENT_TYPE).get_json()
+    coordinator.active_tasks.pop(first['task_id'], None)
+    assert first['status'] == 'returned'
+    assert second['status'] == 'duplicate'
+
+def test_expired_lease_is_dispatched_again():
+    client = coordinator.app.test_client()
+    headers = {'Accept': CONTENT_TYPE}
+    task = Task(task_type=TaskType.MULTIPLY, matrices=[np.random.rand(4, 4), np.random.rand(4, 4)])
+    coordinator.register_task(task)
+    coordinator.dispatch_task(task)
+    response = client.get('/next?worker_id=stalled&wait=0', headers=headers)
+    assert Task.from_bytes(response.data).task_id == task.task_id
+
+    # The worker never reports the task
+    coordinator.leases[task.task_id].deadline = 0
+    coordinator.expire_leases()
+    assert coordinator.redispatches[task.task_id] == 1
+    response = client.get('/next?worker_id=healthy&wait=0', headers=headers)
+    assert Task.from_bytes(response.data).task_id == task.task_id
+    assert coordinator.leases[task.task_id].worker_ids == ['healthy']
+
+    body = encode_frames({'task_id': task.task_id}, [task.matrices[0] @ task.matrices[1]], codecs=())
+    assert client.post('/result', data=body, content_type=CONTENT_TYPE).status_code == 200
+    assert task.task_id not in coordinator.leases
+    assert task.task_id not in coordinator.redispatches
+
+def test_product_cache_evicts_the_least_recently_used():
+    cache = ProductCache(max_bytes=3 * 32)
+    for name in ['a', 'b', 'c']:
+        cache.put(name, np.zeros(4))
+    assert cache.get('a') is not None
+    cache.put('d', np.zeros(4))
+    assert cache.get('b') is None
+    assert all(cache.get(name) is not None for name in ['a', 'c', 'd'])
+    cache.put('huge', np.zeros(100))
+    assert cache.get('huge') is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (3, 96, 1)
+    assert not cache.get('a').flags.writeable
+
+def test_identical_operands_hash_to_the_same_task():
+    a, b = np.arange(6).reshape(2, 3), np.arange(6).reshape(3, 2)
+    first = Task(task_type=TaskType.MULTIPLY, matrices=[a, b])
+    assert Task(task_type=TaskType.MULTIPLY, matrices=[a.copy(), b.copy()]).task_id == first.task_id
+    assert Task(task_type=TaskType.MULTIPLY, matrices=[a.astype(np.int8), b]).task_id != first.task_id
+    assert Task(task_type=TaskType.MULTIPLY, matrices=[b.T, a.T]).task_id != first.task_id
@@ -0,0 +1,28 @@
+import os
+import sys
+import time
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+from scheduler import ReadyQueue
+
+def test_ready_queue_serves_by_priority():
+    queue = ReadyQueue(levels=3)
+    queue.put("leaf", 2)
+    queue.put("root", 1)
+    queue.put("combine", 0)
+    assert [queue.get(0) for _ in range(3)] == ["combine", "root", "leaf"]
+    assert queue.get(0) is None
+
+def test_ready_queue_holds_delayed_tasks():
+    queue = ReadyQueue(levels=3)
+    queue.put("retry", 0, delay=0.2)
+    queue.put("leaf", 2)
+    assert queue.get(0) == "leaf"
+    assert queue.get(0) is None
+    assert queue.depths() == [0, 0, 0, 1]
+    start = time.time()
+    assert queue.get(1) == "retry"
+    assert 0.1 < time.time() - start < 0.9
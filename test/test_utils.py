@@ -0,0 +1,104 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+from utils import WorkspacePool, assemble_blocks, batch_levels, batched_strassen, block_products, tile_grid, tile_products, cast_result, compute_dtypes, float64_exact, is_zero_matrix, local_strassen, csr_multiply, pad_matrices, peel_corrections, product_shape, strassen_combine, strassen_products, sparse_multiply, unpad_matrix
+
+def reference(a, b):
+    """a @ b computed in int64, so small integer types cannot overflow"""
+    return a.astype(np.int64) @ b.astype(np.int64)
+
+def test_zero_products_are_filled_without_multiplying():
+    a = np.random.randint(-9, 10, size=(5, 3))
+    b = np.random.randint(-9, 10, size=(3, 6))
+    padded_a, padded_b, shape_a, shape_b = pad_matrices(a, b)
+    results = []
+    skipped = 0
+    for x, y in strassen_products(padded_a, padded_b):
+        if is_zero_matrix(x) or is_zero_matrix(y):
+            shape, dtype = product_shape(x, y)
+            results.append(np.zeros(shape, dtype=dtype))
+            skipped += 1
+        else:
+            results.append(x @ y)
+    # Padding 5x3 @ 3x6 to 8x8 leaves A12 and B21 all zero, so M7 has a zero factor
+    assert skipped >= 1
+    assert np.array_equal(unpad_matrix(strassen_combine(results), shape_a, shape_b), reference(a, b))
+
+def test_peeled_strassen_handles_odd_and_rectangular_shapes():
+    for m, k, n in [(5, 7, 3), (4, 5, 6), (7, 4, 9), (6, 8, 4), (3, 3, 3)]:
+        a = np.random.randint(-9, 10, size=(m, k)).astype(np.int64)
+        b = np.random.randint(-9, 10, size=(k, n)).astype(np.int64)
+        results = [x @ y for x, y in strassen_products(a, b)]
+        assert np.array_equal(strassen_combine(results, peel_corrections(a, b)), reference(a, b)), (m, k, n)
+
+def test_integer_products_accumulate_exactly():
+    a = np.random.randint(-128, 128, size=(9, 6)).astype(np.int8)
+    b = np.random.randint(-128, 128, size=(6, 5)).astype(np.int8)
+    compute_dtype, result_dtype = compute_dtypes(a, b)
+    assert (compute_dtype, result_dtype) == (np.float64, np.int64)
+    result = cast_result(a.astype(compute_dtype) @ b.astype(compute_dtype), result_dtype)
+    assert result.dtype == np.int64 and np.array_equal(result, reference(a, b))
+
+    # Entries this large could round in float64, so they stay in int64
+    large = np.full((4, 4), 2 ** 30, dtype=np.int64)
+    assert not float64_exact(large, large)
+    assert compute_dtypes(large, large) == (np.int64, np.int64)
+    assert compute_dtypes(a, b, accumulate="int64") == (np.int64, np.int64)
+
+def test_float_products_keep_their_precision():
+    a = np.random.rand(3, 3).astype(np.float32)
+    assert compute_dtypes(a, a) == (np.float32, np.float32)
+    with pytest.raises(ValueError):
+        compute_dtypes(np.array([["x"]]), np.array([["y"]]))
+
+def test_local_strassen_winograd_matches_matmul():
+    pool = WorkspacePool()
+    for m, k, n in [(16, 16, 16), (37, 21, 29), (8, 33, 5), (64, 3, 64)]:
+        a = np.random.randint(-99, 100, size=(m, k)).astype(np.int64)
+        b = np.random.randint(-99, 100, size=(k, n)).astype(np.int64)
+        # A second run reuses the scratch arrays the first gave back
+        for _ in range(2):
+            assert np.array_equal(local_strassen(a, b, 2, pool), reference(a, b)), (m, k, n)
+    a, b = np.random.rand(40, 40), np.random.rand(40, 40)
+    assert np.allclose(local_strassen(a, b, 4, pool), a @ b)
+
+def test_sparse_products_match_dense():
+    a = np.random.randint(-9, 10, size=(30, 40)).astype(np.int16)
+    b = np.random.randint(-9, 10, size=(40, 20)).astype(np.int16)
+    a[np.random.rand(*a.shape) > 0.05] = 0
+    a[:, 10:15] = 0
+    b[25:, :] = 0
+    expected = reference(a, b)
+    assert np.array_equal(csr_multiply(a.astype(np.int64), b.astype(np.int64)), expected)
+    # Sparse A, sparse B (transposed onto the CSR side) and a dense fallback after compaction
+    for x, y, cutoff in [(a, b, 0.1), (b.T, a.T, 0.1), (a, b, 0.0)]:
+        result = sparse_multiply(x.astype(np.int64), y.astype(np.int64), cutoff)
+        assert np.array_equal(result, expected if x is a else expected.T), cutoff
+    assert not sparse_multiply(np.zeros((3, 40)), b, 0.1).any()
+
+def test_tiles_and_blocks_assemble_into_the_product():
+    a = np.random.randint(-9, 10, size=(23, 17)).astype(np.int32)
+    b = np.random.randint(-9, 10, size=(17, 11)).astype(np.int32)
+    expected = reference(a, b)
+    rows, cols = tile_grid(23, 11, 6)
+    tiles = tile_products(a.astype(np.int64), b.astype(np.int64), rows, cols, 3)
+    results = [sum(x @ y for x, y in zip(tile[::2], tile[1::2])) for tile in tiles]
+    assert np.array_equal(assemble_blocks("tiles", results, cols), expected)
+    for kind in ["rows", "cols", "inner"]:
+        results = [x @ y for x, y in block_products(a.astype(np.int64), b.astype(np.int64), kind, 4)]
+        assert np.array_equal(assemble_blocks(kind, results), expected), kind
+
+def test_batched_strassen_matches_matmul():
+    for m, k, n in [(32, 32, 32), (45, 19, 30), (7, 7, 7)]:
+        a = np.random.randint(-99, 100, size=(m, k)).astype(np.int64)
+        b = np.random.randint(-99, 100, size=(k, n)).astype(np.int64)
+        levels = batch_levels(a, b, 4)
+        assert levels >= 1
+        assert np.array_equal(batched_strassen(a, b, levels), reference(a, b)), (m, k, n)
+    assert batch_levels(np.zeros((8, 8)), np.zeros((8, 8)), 8) == 0
@@ -0,0 +1,62 @@
+import os
+import sys
+import subprocess
+import numpy as np
+from collections import Counter
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+import wire
+from wire import ENCODINGS, FrameStream, encode_frames, decode_frames
+
+def test_empty_matrices_round_trip():
+    """Matrices with a zero dimension are sent as a header with no payload"""
+    matrices = [np.zeros((0, 5)), np.zeros((5, 0), dtype=np.int32), np.arange(6).reshape(2, 3)]
+    for codecs in [(), ENCODINGS]:
+        meta, decoded = decode_frames(encode_frames({'task_id': 't'}, matrices, codecs=codecs))
+        assert meta == {'task_id': 't'}
+        for matrix, result in zip(matrices, decoded):
+            assert result.shape == matrix.shape and result.dtype == matrix.dtype
+            assert np.array_equal(result, matrix)
+
+def test_empty_matrices_stream():
+    matrices = [np.zeros((0, 5)), np.ones((3, 4))]
+    stream = FrameStream({}, matrices, chunk_bytes=16)
+    body = b"".join(bytes(chunk) for chunk in stream)
+    assert len(body) == len(stream)
+    _, decoded = decode_frames(body)
+    assert decoded[0].shape == (0, 5)
+    assert np.array_equal(decoded[1], matrices[1])
+
+def test_zlib_only_deflates_compressible_frames():
+    noise = np.random.randint(0, 2 ** 62, size=(512, 512), dtype=np.int64)
+    repeated = np.tile(np.arange(512, dtype=np.float64), (512, 1))
+    for matrix, deflated in [(noise, 0), (repeated, 1)]:
+        stats = Counter()
+        _, (result,) = decode_frames(encode_frames({}, [matrix], codecs=("zlib",), stats=stats))
+        assert stats["zlib"] == deflated
+        assert np.array_equal(result, matrix)
+
+def test_files_of_dead_senders_are_removed(tmp_path, monkeypatch):
+    """Shared-memory files are removed at startup once their sender is gone, and only then"""
+    monkeypatch.setattr(wire, "SHM_DIR", str(tmp_path))
+    monkeypatch.setattr(wire, "_PID_NAMESPACE", "1234")
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    names = [f"1234-{dead.pid}-a.blk", f"1234-{os.getpid()}-b.blk", f"5678-{dead.pid}-c.blk", "host_id"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"")
+    wire._remove_stale_files()
+    assert sorted(os.listdir(tmp_path)) == sorted(names[1:])
+
+def test_negative_zero_survives_narrowing():
+    """Integer-valued floats are narrowed unless that would turn -0.0 into +0.0"""
+    matrix = np.arange(-8.0, 8.0).reshape(4, 4)
+    matrix[2, 2] = -0.0
+    stats = Counter()
+    _, decoded = decode_frames(encode_frames({}, [matrix, np.abs(matrix)], codecs=("narrow",), stats=stats))
+    assert stats["narrow"] == 1
+    assert decoded[0].dtype == np.float64 and np.signbit(decoded[0][2, 2])
+    assert np.array_equal(decoded[1], np.abs(matrix)) and not np.signbit(decoded[1]).any()
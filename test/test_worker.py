@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+import numpy as np
+
+curr_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(curr_dir)
+sys.path.insert(0, os.path.join(parent_dir, "app"))
+
+import worker
+from utils import is_zero_matrix, peel_corrections, product_shape, strassen_products
+from wire import CONTENT_TYPE, encode_frames
+
+def test_routed_combine_collects_deliveries_around_the_announcement():
+    if worker.executor is None:
+        worker.start_executor()
+    client = worker.app.test_client()
+    a = np.random.randint(-9, 10, size=(5, 7))
+    b = np.random.randint(-9, 10, size=(7, 6))
+    b[:, 3:] = 0
+    products = strassen_products(a, b)
+    peel = peel_corrections(a, b)
+    zeros = [i for i, (x, y) in enumerate(products) if is_zero_matrix(x) or is_zero_matrix(y)]
+    assert zeros
+
+    reported = {}
+    done = threading.Event()
+    send = worker.send_result_to_coordinator
+
+    def capture(task_id, result, source_id=None):
+        reported[task_id] = result.copy()
+        done.set()
+        return True
+
+    def post_delivery(m_number):
+        x, y = products[m_number]
+        body = encode_frames({'slot': 'routed-split', 'm_number': m_number}, [x @ y], codecs=())
+        assert client.post('/deliver', data=body, content_type=CONTENT_TYPE).status_code == 200
+
+    worker.send_result_to_coordinator = capture
+    try:
+        # Deliveries may reach the combine worker before the coordinator's announcement
+        delivered = [i for i in range(7) if i not in zeros]
+        post_delivery(delivered[0])
+        meta = {
+            'slot': 'routed-split',
+            'next_route': None,
+            'zeros': [{'m_number': i, 'zero_shape': list(product_shape(*products[i])[0]), 'zero_dtype': str(product_shape(*products[i])[1])} for i in zeros],
+            'peel_keys': list(peel)
+        }
+        body = encode_frames(meta, list(peel.values()), codecs=())
+        assert client.post('/expect', data=body, content_type=CONTENT_TYPE).status_code == 200
+        assert not done.is_set()
+        for m_number in delivered[1:]:
+            post_delivery(m_number)
+        assert done.wait(10)
+    finally:
+        worker.send_result_to_coordinator = send
+    assert np.array_equal(reported['routed-split'], a @ b)